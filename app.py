@@ -1,18 +1,33 @@
+import hmac
+import json
 import logging
 import time
+from datetime import datetime, timezone
 from typing import Optional
 from uuid import uuid4
 
-from flask import Flask, g, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 
 from config import Config
+from services.collections import validate_collection_name
+from services.compaction import CompactionTask
 from services.ingest import IngestService
 from services.jobs import JobService
-from services.search import SearchService, SentenceTransformerEmbedder
+from services.replication import ROLE_INDEXER, ROLE_SEARCHER, ROLES, IndexPublisher, IndexSubscriber
+from services.search import CursorExpiredError, SearchService, SentenceTransformerEmbedder
+from services.snapshot import SnapshotService
 from services.storage import StorageService
 from utils.files import is_allowed_extension
 from openapi import get_openapi_spec
 
+MAX_BULK_JOB_IDS = 100
+INGESTION_ENDPOINTS = frozenset(
+    {"upload_document", "replace_document", "delete_document", "get_jobs", "job_events", "get_job", "cancel_job"}
+)
+SEARCH_ENDPOINTS = frozenset({"search"})
+# Snapshots export the local database, which a searcher does not index into.
+ADMIN_ENDPOINTS = frozenset({"create_snapshot", "list_snapshots"})
+
 
 def _build_services(config: Config, embedder=None):
     embedder = embedder or SentenceTransformerEmbedder(config.model_name)
@@ -23,18 +38,37 @@ def _build_services(config: Config, embedder=None):
         uploads_dir=config.uploads_dir,
         max_chunk_size=config.max_chunk_size,
         chunk_overlap=config.chunk_overlap,
+        batch_size=config.ingest_batch_size,
+        max_chunk_tokens=config.max_chunk_tokens or None,
+        chunk_overlap_tokens=config.chunk_overlap_tokens,
+    )
+    search_service = SearchService(
+        storage_service=storage_service,
+        embedder=embedder,
+        ranking_cache_size=config.search_ranking_cache_size,
+        memory_budget_bytes=config.collection_memory_budget_mb * 1024 * 1024,
     )
-    search_service = SearchService(storage_service=storage_service, embedder=embedder)
     job_service = JobService(
         storage_service=storage_service,
         ingest_service=ingest_service,
         max_workers=config.ingestion_workers,
+        spool_dir=config.jobs_spool_dir,
+        max_attempts=config.job_max_attempts,
+        retry_backoff_seconds=config.job_retry_backoff_seconds,
+        lease_seconds=config.job_lease_seconds,
+        heartbeat_seconds=config.job_heartbeat_seconds,
+        poll_interval_seconds=config.job_poll_interval_seconds,
+        small_job_max_bytes=config.small_job_max_bytes,
+        collection_max_workers=config.collection_max_workers,
+        collection_worker_quotas=config.collection_worker_quotas,
     )
     return storage_service, ingest_service, search_service, job_service
 
 
 def create_app(config: Optional[Config] = None, embedder=None) -> Flask:
     config = config or Config()
+    if config.role not in ROLES:
+        raise ValueError(f"Unknown ROLE '{config.role}'. Expected one of: {', '.join(ROLES)}.")
     config.ensure_runtime_dirs()
 
     app = Flask(__name__)
@@ -42,11 +76,58 @@ def create_app(config: Optional[Config] = None, embedder=None) -> Flask:
 
     logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
     storage_service, ingest_service, search_service, job_service = _build_services(config, embedder=embedder)
+    snapshot_service = SnapshotService(
+        storage_service=storage_service, snapshots_dir=config.snapshots_dir, model_name=config.model_name
+    )
+    app.extensions["job_service"] = job_service
+    if config.embedded_workers and config.role != ROLE_SEARCHER:
+        job_service.start()
+
+    if config.role != ROLE_SEARCHER:
+        compaction = CompactionTask(
+            storage_service=storage_service,
+            threshold=config.compaction_threshold,
+            interval_seconds=config.compaction_interval_seconds,
+            vacuum=config.compaction_vacuum,
+            pending_grace_seconds=config.job_lease_seconds,
+        )
+        app.extensions["compaction"] = compaction
+        compaction.start()
+
+    disabled_endpoints = frozenset()
+    if config.role == ROLE_INDEXER:
+        disabled_endpoints = SEARCH_ENDPOINTS
+        publisher = IndexPublisher(
+            storage_service=storage_service,
+            publish_dir=config.index_publish_dir,
+            model_name=config.model_name,
+            interval_seconds=config.index_publish_interval_seconds,
+            keep_generations=config.index_keep_generations,
+        )
+        app.extensions["index_publisher"] = publisher
+        publisher.start()
+    elif config.role == ROLE_SEARCHER:
+        disabled_endpoints = INGESTION_ENDPOINTS | ADMIN_ENDPOINTS
+        subscriber = IndexSubscriber(
+            search_service=search_service,
+            publish_dir=config.index_publish_dir,
+            local_dir=config.searcher_data_dir,
+            model_name=config.model_name,
+            interval_seconds=config.index_watch_interval_seconds,
+        )
+        app.extensions["index_subscriber"] = subscriber
+        try:
+            subscriber.refresh()
+        except Exception:
+            logging.exception("Failed to load the published index generation at startup")
+        subscriber.start()
 
     @app.before_request
     def before_request():
         g.request_id = request.headers.get("X-Request-ID", str(uuid4()))
         g.start_time = time.perf_counter()
+        if request.endpoint in disabled_endpoints:
+            return jsonify({"error": f"Endpoint not served by a '{config.role}' node."}), 404
 
     @app.after_request
     def after_request(response):
@@ -74,7 +155,10 @@ def create_app(config: Optional[Config] = None, embedder=None) -> Flask:
 
     @app.get("/health")
     def health():
-        return jsonify({"status": "ok"})
+        payload = {"status": "ok", "role": config.role}
+        if "index_subscriber" in app.extensions:
+            payload["generation"] = app.extensions["index_subscriber"].generation
+        return jsonify(payload)
 
     @app.get("/openapi.json")
     def openapi_spec():
@@ -99,8 +183,30 @@ def create_app(config: Optional[Config] = None, embedder=None) -> Flask:
         </html>
         """
 
+    def _requested_collection() -> str:
+        """The ``collection`` query or form parameter; documents and searches default to one collection."""
+        return validate_collection_name(request.values.get("collection"))
+
+    @app.get("/collections")
+    def list_collections():
+        # Searchers list the collections of the index generation they are currently searching.
+        storage = search_service.storage_service
+        resident = search_service.index_cache.resident(storage.database_path)
+        collections = []
+        for item in storage.list_collections():
+            index = resident.get(item["name"])
+            collections.append({**item, "resident_bytes": index.nbytes if index else 0})
+        return jsonify({"collections": collections})
+
     @app.post("/documents")
     def upload_document():
+        try:
+            collection = _requested_collection()
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        return _queue_upload(collection)
+
+    def _queue_upload(collection: str, replaces_document_id: Optional[int] = None):
         if "file" not in request.files:
             return jsonify({"error": "Missing multipart file field named 'file'."}), 400
 
@@ -110,12 +216,14 @@ def create_app(config: Optional[Config] = None, embedder=None) -> Flask:
         if not is_allowed_extension(uploaded.filename):
             return jsonify({"error": "Unsupported file type. Allowed: .txt, .pdf, .docx"}), 400
 
-        payload = uploaded.read()
-        if not payload:
+        if not uploaded.stream.read(1):
             return jsonify({"error": "Uploaded file is empty."}), 400
+        uploaded.stream.seek(0)
 
         try:
-            job = job_service.create_ingestion_job(uploaded.filename, payload)
+            job = job_service.create_ingestion_job(
+                uploaded.filename, uploaded.stream, replaces_document_id=replaces_document_id, collection=collection
+            )
         except ValueError as exc:
             return jsonify({"error": str(exc)}), 400
         except Exception:
@@ -123,16 +231,95 @@ def create_app(config: Optional[Config] = None, embedder=None) -> Flask:
             return jsonify({"error": "Failed to queue ingestion job."}), 500
         return jsonify(job), 202
 
+    @app.put("/documents/<int:document_id>")
+    def replace_document(document_id: int):
+        try:
+            collection = _requested_collection()
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        if not storage_service.document_exists(document_id, collection):
+            return jsonify({"error": "Document not found."}), 404
+        return _queue_upload(collection, replaces_document_id=document_id)
+
+    @app.delete("/documents/<int:document_id>")
+    def delete_document(document_id: int):
+        try:
+            collection = _requested_collection()
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        deleted_at = datetime.now(timezone.utc).isoformat()
+        if not storage_service.tombstone_document(document_id, deleted_at=deleted_at, collection=collection):
+            return jsonify({"error": "Document not found."}), 404
+        return jsonify({"document_id": document_id, "status": "deleted"})
+
+    def _requested_job_ids():
+        job_ids = []
+        for value in request.args.getlist("ids"):
+            job_ids.extend(item.strip() for item in value.split(",") if item.strip())
+        return list(dict.fromkeys(job_ids))
+
+    @app.get("/jobs")
+    def get_jobs():
+        job_ids = _requested_job_ids()
+        if not job_ids:
+            return jsonify({"error": "Query parameter 'ids' is required."}), 400
+        if len(job_ids) > MAX_BULK_JOB_IDS:
+            return jsonify({"error": f"At most {MAX_BULK_JOB_IDS} job ids per request."}), 400
+        jobs = job_service.get_jobs(job_ids)
+        found = {job["id"] for job in jobs}
+        return jsonify({"jobs": jobs, "missing": [job_id for job_id in job_ids if job_id not in found]})
+
+    @app.get("/jobs/events")
+    def job_events():
+        job_ids = _requested_job_ids()
+        if not job_ids:
+            return jsonify({"error": "Query parameter 'ids' is required."}), 400
+        if len(job_ids) > MAX_BULK_JOB_IDS:
+            return jsonify({"error": f"At most {MAX_BULK_JOB_IDS} job ids per request."}), 400
+
+        def stream():
+            for job in job_service.iter_job_events(job_ids, timeout=config.job_event_stream_max_seconds):
+                if job is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"event: job\nid: {job['id']}\ndata: {json.dumps(job)}\n\n"
+            yield "event: end\ndata: {}\n\n"
+
+        return Response(
+            stream_with_context(stream()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     @app.get("/jobs/<string:job_id>")
     def get_job(job_id: str):
-        job = job_service.get_job(job_id)
+        try:
+            wait = float(request.args.get("wait", 0))
+        except ValueError:
+            return jsonify({"error": "Query parameter 'wait' must be a number of seconds."}), 400
+        wait = min(max(wait, 0.0), config.job_long_poll_max_seconds)
+        job = job_service.wait_for_job(job_id, timeout=wait) if wait else job_service.get_job(job_id)
         if not job:
             return jsonify({"error": "Job not found."}), 404
         return jsonify(job)
 
+    @app.post("/jobs/<string:job_id>/cancel")
+    def cancel_job(job_id: str):
+        job = job_service.cancel_job(job_id)
+        if job:
+            return jsonify(job)
+        if not job_service.get_job(job_id):
+            return jsonify({"error": "Job not found."}), 404
+        return jsonify({"error": "Only queued jobs can be cancelled."}), 409
+
     @app.get("/documents/<int:document_id>")
     def get_document(document_id: int):
-        document = storage_service.get_document(document_id)
+        try:
+            collection = _requested_collection()
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        # Searchers serve documents from the index generation they are currently searching.
+        document = search_service.storage_service.get_document(document_id, collection)
         if not document:
             return jsonify({"error": "Document not found."}), 404
         return jsonify(document)
@@ -144,20 +331,104 @@ def create_app(config: Optional[Config] = None, embedder=None) -> Flask:
             return jsonify({"error": "Query parameter 'q' is required."}), 400
         top_k = min(max(int(request.args.get("top_k", config.max_search_results)), 1), 100)
         min_score = float(request.args.get("min_score", config.min_similarity_score))
+        cursor = request.args.get("cursor") or None
+        stream_results = request.args.get("format") == "ndjson"
+        fusion = (request.args.get("fusion") or config.search_fusion).lower()
 
         try:
-            results = search_service.hybrid_search(
+            collection = _requested_collection()
+            results, next_cursor = search_service.search_page(
                 query=query,
                 limit=top_k,
+                cursor=cursor,
                 min_score=min_score,
                 semantic_weight=config.hybrid_semantic_weight,
                 lexical_weight=config.hybrid_lexical_weight,
-                rerank_top_k=config.rerank_top_k,
+                depth=config.search_ranking_depth,
+                collection=collection,
+                fusion=fusion,
+                semantic_candidates=config.semantic_candidates,
+                lexical_candidates=config.lexical_candidates,
+                rrf_k=config.rrf_k,
             )
+            if not stream_results:
+                # Materialize inside the try so storage errors still map to a 500 response.
+                results = list(results)
+        except CursorExpiredError as exc:
+            return jsonify({"error": str(exc)}), 410
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
         except Exception:
             logging.exception("Search failed")
             return jsonify({"error": "Search failed."}), 500
-        return jsonify({"query": query, "count": len(results), "results": results, "mode": "hybrid"})
+
+        if not stream_results:
+            return jsonify(
+                {
+                    "query": query,
+                    "collection": collection,
+                    "count": len(results),
+                    "results": results,
+                    "mode": "hybrid",
+                    "fusion": fusion,
+                    "next_cursor": next_cursor,
+                }
+            )
+
+        def stream():
+            count = 0
+            try:
+                for result in results:
+                    count += 1
+                    yield json.dumps({"type": "result", "result": result}) + "\n"
+            except Exception:
+                logging.exception("Search failed while streaming results")
+                yield json.dumps({"type": "error", "error": "Search failed."}) + "\n"
+                return
+            yield json.dumps(
+                {
+                    "type": "end",
+                    "query": query,
+                    "collection": collection,
+                    "count": count,
+                    "mode": "hybrid",
+                    "fusion": fusion,
+                    "next_cursor": next_cursor,
+                }
+            ) + "\n"
+
+        return Response(stream_with_context(stream()), mimetype="application/x-ndjson")
+
+    def _admin_denied():
+        if not config.admin_token:
+            return jsonify({"error": "Admin API is disabled; set ADMIN_TOKEN to enable it."}), 403
+        # Constant-time comparison; bytes so non-ASCII header values are rejected rather than raising.
+        supplied = request.headers.get("X-Admin-Token", "").encode("utf-8")
+        if not hmac.compare_digest(supplied, config.admin_token.encode("utf-8")):
+            return jsonify({"error": "Invalid admin token."}), 401
+        return None
+
+    @app.post("/admin/snapshots")
+    def create_snapshot():
+        denied = _admin_denied()
+        if denied:
+            return denied
+        name = (request.get_json(silent=True) or {}).get("name")
+        try:
+            manifest = snapshot_service.create_snapshot(name)
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        except Exception:
+            logging.exception("Snapshot export failed")
+            return jsonify({"error": "Snapshot export failed."}), 500
+        return jsonify(manifest), 201
+
+    @app.get("/admin/snapshots")
+    def list_snapshots():
+        denied = _admin_denied()
+        if denied:
+            return denied
+        return jsonify({"snapshots": snapshot_service.list_snapshots()})
 
     @app.errorhandler(413)
     def payload_too_large(_):
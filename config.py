@@ -1,6 +1,17 @@
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict
+
+
+def _parse_quotas(value: str) -> Dict[str, int]:
+    """Parse ``name=limit`` pairs separated by commas, e.g. ``"team-a=2,team-b=1"``."""
+    quotas = {}
+    for item in value.split(","):
+        if item.strip():
+            name, _, limit = item.partition("=")
+            quotas[name.strip()] = int(limit)
+    return quotas
 
 
 @dataclass
@@ -14,12 +25,46 @@ class Config:
     max_content_length: int = int(os.getenv("MAX_CONTENT_LENGTH", 16 * 1024 * 1024))
     max_chunk_size: int = int(os.getenv("MAX_CHUNK_SIZE", 450))
     chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP", 70))
+    max_chunk_tokens: int = int(os.getenv("MAX_CHUNK_TOKENS", 0))
+    chunk_overlap_tokens: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))
+    ingest_batch_size: int = int(os.getenv("INGEST_BATCH_SIZE", 64))
     max_search_results: int = int(os.getenv("MAX_SEARCH_RESULTS", 10))
     min_similarity_score: float = float(os.getenv("MIN_SIMILARITY_SCORE", 0.1))
     hybrid_semantic_weight: float = float(os.getenv("HYBRID_SEMANTIC_WEIGHT", 0.75))
     hybrid_lexical_weight: float = float(os.getenv("HYBRID_LEXICAL_WEIGHT", 0.25))
-    rerank_top_k: int = int(os.getenv("RERANK_TOP_K", 30))
+    search_ranking_depth: int = int(os.getenv("SEARCH_RANKING_DEPTH", 1000))
+    search_ranking_cache_size: int = int(os.getenv("SEARCH_RANKING_CACHE_SIZE", 128))
+    search_fusion: str = os.getenv("SEARCH_FUSION", "weighted").lower()
+    semantic_candidates: int = int(os.getenv("SEMANTIC_CANDIDATES", 200))
+    lexical_candidates: int = int(os.getenv("LEXICAL_CANDIDATES", 200))
+    rrf_k: int = int(os.getenv("RRF_K", 60))
+    collection_memory_budget_mb: int = int(os.getenv("COLLECTION_MEMORY_BUDGET_MB", 512))
     ingestion_workers: int = int(os.getenv("INGESTION_WORKERS", 2))
+    embedded_workers: bool = os.getenv("EMBEDDED_WORKERS", "true").lower() == "true"
+    jobs_spool_dir: str = os.getenv("JOBS_SPOOL_DIR", "data/spool")
+    job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    job_retry_backoff_seconds: float = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", 2.0))
+    job_lease_seconds: float = float(os.getenv("JOB_LEASE_SECONDS", 60.0))
+    job_heartbeat_seconds: float = float(os.getenv("JOB_HEARTBEAT_SECONDS", 15.0))
+    job_poll_interval_seconds: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", 1.0))
+    small_job_max_bytes: int = int(os.getenv("SMALL_JOB_MAX_BYTES", 1024 * 1024))
+    job_long_poll_max_seconds: float = float(os.getenv("JOB_LONG_POLL_MAX_SECONDS", 60.0))
+    job_event_stream_max_seconds: float = float(os.getenv("JOB_EVENT_STREAM_MAX_SECONDS", 300.0))
+    collection_max_workers: int = int(os.getenv("COLLECTION_MAX_WORKERS", 0))
+    collection_worker_quotas: Dict[str, int] = field(
+        default_factory=lambda: _parse_quotas(os.getenv("COLLECTION_WORKER_QUOTAS", ""))
+    )
+    compaction_threshold: float = float(os.getenv("COMPACTION_THRESHOLD", 0.2))
+    compaction_interval_seconds: float = float(os.getenv("COMPACTION_INTERVAL_SECONDS", 300.0))
+    compaction_vacuum: bool = os.getenv("COMPACTION_VACUUM", "true").lower() == "true"
+    role: str = os.getenv("ROLE", "combined").lower()
+    index_publish_dir: str = os.getenv("INDEX_PUBLISH_DIR", "data/generations")
+    index_publish_interval_seconds: float = float(os.getenv("INDEX_PUBLISH_INTERVAL_SECONDS", 30.0))
+    index_keep_generations: int = int(os.getenv("INDEX_KEEP_GENERATIONS", 3))
+    searcher_data_dir: str = os.getenv("SEARCHER_DATA_DIR", "data/searcher")
+    index_watch_interval_seconds: float = float(os.getenv("INDEX_WATCH_INTERVAL_SECONDS", 5.0))
+    snapshots_dir: str = os.getenv("SNAPSHOTS_DIR", "data/snapshots")
+    admin_token: str = os.getenv("ADMIN_TOKEN", "")
     flask_debug: bool = os.getenv("FLASK_DEBUG", "false").lower() == "true"
     port: int = int(os.getenv("PORT", 5000))
 
@@ -27,3 +72,5 @@ class Config:
         """Create required runtime directories if missing."""
         Path(self.uploads_dir).mkdir(parents=True, exist_ok=True)
         Path(self.database_path).parent.mkdir(parents=True, exist_ok=True)
+        Path(self.jobs_spool_dir).mkdir(parents=True, exist_ok=True)
+        Path(self.snapshots_dir).mkdir(parents=True, exist_ok=True)
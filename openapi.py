@@ -23,21 +23,90 @@ def get_openapi_spec():
                     "responses": {"202": {"description": "Job accepted"}},
                 }
             },
+            "/collections": {
+                "get": {
+                    "summary": "List collections with document counts and resident index size",
+                    "responses": {"200": {"description": "Collections"}},
+                }
+            },
+            "/jobs": {
+                "get": {
+                    "summary": "Get status for many ingestion jobs",
+                    "parameters": [{"name": "ids", "in": "query", "required": True, "schema": {"type": "string"}}],
+                    "responses": {"200": {"description": "Job statuses and unknown ids"}},
+                }
+            },
+            "/jobs/events": {
+                "get": {
+                    "summary": "Server-sent events stream of job state changes",
+                    "parameters": [{"name": "ids", "in": "query", "required": True, "schema": {"type": "string"}}],
+                    "responses": {"200": {"description": "text/event-stream of job events"}},
+                }
+            },
             "/jobs/{job_id}": {
                 "get": {
                     "summary": "Get ingestion job status",
-                    "parameters": [{"name": "job_id", "in": "path", "required": True, "schema": {"type": "string"}}],
+                    "parameters": [
+                        {"name": "job_id", "in": "path", "required": True, "schema": {"type": "string"}},
+                        {"name": "wait", "in": "query", "required": False, "schema": {"type": "number"}},
+                    ],
                     "responses": {"200": {"description": "Job status"}},
                 }
             },
+            "/jobs/{job_id}/cancel": {
+                "post": {
+                    "summary": "Cancel a queued ingestion job",
+                    "parameters": [{"name": "job_id", "in": "path", "required": True, "schema": {"type": "string"}}],
+                    "responses": {
+                        "200": {"description": "Job cancelled"},
+                        "404": {"description": "Not found"},
+                        "409": {"description": "Job already running or finished"},
+                    },
+                }
+            },
             "/documents/{document_id}": {
                 "get": {
                     "summary": "Get indexed document content",
                     "parameters": [
-                        {"name": "document_id", "in": "path", "required": True, "schema": {"type": "integer"}}
+                        {"name": "document_id", "in": "path", "required": True, "schema": {"type": "integer"}},
+                        {"name": "collection", "in": "query", "required": False, "schema": {"type": "string"}},
                     ],
                     "responses": {"200": {"description": "Document found"}, "404": {"description": "Not found"}},
-                }
+                },
+                "put": {
+                    "summary": "Replace a document's content (queues a re-ingestion job)",
+                    "parameters": [
+                        {"name": "document_id", "in": "path", "required": True, "schema": {"type": "integer"}},
+                        {"name": "collection", "in": "query", "required": False, "schema": {"type": "string"}},
+                    ],
+                    "requestBody": {
+                        "required": True,
+                        "content": {"multipart/form-data": {"schema": {"type": "object"}}},
+                    },
+                    "responses": {"202": {"description": "Job accepted"}, "404": {"description": "Not found"}},
+                },
+                "delete": {
+                    "summary": "Delete a document",
+                    "parameters": [
+                        {"name": "document_id", "in": "path", "required": True, "schema": {"type": "integer"}},
+                        {"name": "collection", "in": "query", "required": False, "schema": {"type": "string"}},
+                    ],
+                    "responses": {"200": {"description": "Document deleted"}, "404": {"description": "Not found"}},
+                },
+            },
+            "/admin/snapshots": {
+                "post": {
+                    "summary": "Export a consistent index snapshot (requires X-Admin-Token)",
+                    "requestBody": {
+                        "required": False,
+                        "content": {"application/json": {"schema": {"type": "object"}}},
+                    },
+                    "responses": {"201": {"description": "Snapshot manifest"}, "401": {"description": "Bad token"}},
+                },
+                "get": {
+                    "summary": "List index snapshots (requires X-Admin-Token)",
+                    "responses": {"200": {"description": "Snapshot manifests"}, "401": {"description": "Bad token"}},
+                },
             },
             "/search": {
                 "get": {
@@ -46,8 +115,26 @@ def get_openapi_spec():
                         {"name": "q", "in": "query", "required": True, "schema": {"type": "string"}},
                         {"name": "top_k", "in": "query", "required": False, "schema": {"type": "integer"}},
                         {"name": "min_score", "in": "query", "required": False, "schema": {"type": "number"}},
+                        {"name": "cursor", "in": "query", "required": False, "schema": {"type": "string"}},
+                        {"name": "collection", "in": "query", "required": False, "schema": {"type": "string"}},
+                        {
+                            "name": "format",
+                            "in": "query",
+                            "required": False,
+                            "schema": {"type": "string", "enum": ["json", "ndjson"]},
+                        },
+                        {
+                            "name": "fusion",
+                            "in": "query",
+                            "required": False,
+                            "schema": {"type": "string", "enum": ["weighted", "rrf", "normalized"]},
+                        },
                     ],
-                    "responses": {"200": {"description": "Ranked search results"}},
+                    "responses": {
+                        "200": {"description": "Ranked search results (JSON, or NDJSON lines with format=ndjson)"},
+                        "400": {"description": "Missing query or invalid cursor"},
+                        "410": {"description": "Cursor expired"},
+                    },
                 }
             },
         },
@@ -1,12 +1,14 @@
 import argparse
 import json
 import sys
+import time
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 from app import _build_services
 from config import Config
+from services.search import FUSION_MODES
 
 
 def precision_at_k(relevant_ids, predicted_ids, k: int) -> float:
@@ -24,16 +26,34 @@ def reciprocal_rank(relevant_ids, predicted_ids) -> float:
     return 0.0
 
 
-def run_evaluation(eval_file: Path):
-    config = Config()
-    _, _, search_service, _ = _build_services(config)
-    payload = json.loads(eval_file.read_text(encoding="utf-8"))
-    queries = payload["queries"]
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
 
+def evaluate_mode(search_service, config: Config, queries, fusion: str, repeats: int):
     p_at_3_values = []
     rr_values = []
+    latencies_ms = []
     for query_case in queries:
-        results = search_service.hybrid_search(query_case["query"], limit=5, min_score=-1.0)
+        for _ in range(repeats):
+            # Time full retrieval, not a cached ranking from the previous repeat or mode.
+            search_service.clear_ranking_cache()
+            started = time.perf_counter()
+            results = search_service.hybrid_search(
+                query_case["query"],
+                limit=5,
+                min_score=-1.0,
+                semantic_weight=config.hybrid_semantic_weight,
+                lexical_weight=config.hybrid_lexical_weight,
+                fusion=fusion,
+                semantic_candidates=config.semantic_candidates,
+                lexical_candidates=config.lexical_candidates,
+                rrf_k=config.rrf_k,
+            )
+            latencies_ms.append((time.perf_counter() - started) * 1000)
         predicted = [item["document_id"] for item in results]
         relevant = query_case["relevant_document_ids"]
         p_at_3_values.append(precision_at_k(relevant, predicted, 3))
@@ -41,11 +61,46 @@ def run_evaluation(eval_file: Path):
 
     avg_p_at_3 = sum(p_at_3_values) / len(p_at_3_values) if p_at_3_values else 0.0
     mrr = sum(rr_values) / len(rr_values) if rr_values else 0.0
-    print(json.dumps({"queries": len(queries), "precision_at_3": round(avg_p_at_3, 4), "mrr": round(mrr, 4)}))
+    mean_ms = sum(latencies_ms) / len(latencies_ms) if latencies_ms else 0.0
+    return {
+        "precision_at_3": round(avg_p_at_3, 4),
+        "mrr": round(mrr, 4),
+        "latency_ms": {
+            "mean": round(mean_ms, 3),
+            "p50": round(percentile(latencies_ms, 0.5), 3),
+            "p95": round(percentile(latencies_ms, 0.95), 3),
+        },
+    }
+
+
+def run_evaluation(eval_file: Path, modes, repeats: int):
+    config = Config()
+    _, _, search_service, _ = _build_services(config)
+    payload = json.loads(eval_file.read_text(encoding="utf-8"))
+    queries = payload["queries"]
+
+    # Warm the query-embedding cache and the resident index so no mode pays for them.
+    for query_case in queries:
+        search_service.hybrid_search(query_case["query"], limit=5, min_score=-1.0)
+
+    report = {"queries": len(queries), "repeats": repeats, "modes": {}}
+    for fusion in modes:
+        report["modes"][fusion] = evaluate_mode(search_service, config, queries, fusion, repeats)
+    print(json.dumps(report))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Evaluate semantic search quality with labeled queries.")
     parser.add_argument("--eval-file", default="eval/sample_queries.json", help="Path to evaluation query file.")
+    parser.add_argument(
+        "--modes",
+        default=",".join(FUSION_MODES),
+        help="Comma-separated fusion modes to compare (default: all).",
+    )
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per query and mode.")
     args = parser.parse_args()
-    run_evaluation(Path(args.eval_file))
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in modes if mode not in FUSION_MODES]
+    if unknown:
+        parser.error(f"unknown fusion modes: {', '.join(unknown)}")
+    run_evaluation(Path(args.eval_file), modes, max(args.repeats, 1))
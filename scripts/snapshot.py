@@ -0,0 +1,64 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from config import Config
+from services.snapshot import SnapshotService, restore_snapshot
+from services.storage import StorageService
+
+
+def export_snapshot(name: str) -> None:
+    config = Config()
+    config.ensure_runtime_dirs()
+    snapshot_service = SnapshotService(
+        storage_service=StorageService(config.database_path),
+        snapshots_dir=config.snapshots_dir,
+        model_name=config.model_name,
+    )
+    print(json.dumps(snapshot_service.create_snapshot(name or None)))
+
+
+def list_snapshots() -> None:
+    config = Config()
+    snapshot_service = SnapshotService(
+        storage_service=StorageService(config.database_path),
+        snapshots_dir=config.snapshots_dir,
+        model_name=config.model_name,
+    )
+    print(json.dumps(snapshot_service.list_snapshots()))
+
+
+def restore(snapshot_dir: str, database_path: str, allow_model_mismatch: bool) -> None:
+    config = Config()
+    target = database_path or config.database_path
+    expected_model = None if allow_model_mismatch else config.model_name
+    manifest = restore_snapshot(snapshot_dir, target, expected_model=expected_model)
+    print(json.dumps({"restored": manifest["name"], "database_path": target, "counts": manifest["counts"]}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export, list, and restore index snapshots.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Write a snapshot of DATABASE_PATH to SNAPSHOTS_DIR.")
+    export_parser.add_argument("--name", default="", help="Snapshot name (default: timestamped).")
+
+    subparsers.add_parser("list", help="List snapshots in SNAPSHOTS_DIR.")
+
+    restore_parser = subparsers.add_parser("restore", help="Bulk-load a snapshot into a fresh database.")
+    restore_parser.add_argument("snapshot_dir", help="Path to the snapshot directory.")
+    restore_parser.add_argument("--database-path", default="", help="Target database (default: DATABASE_PATH).")
+    restore_parser.add_argument(
+        "--allow-model-mismatch", action="store_true", help="Restore even if MODEL_NAME differs from the snapshot."
+    )
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_snapshot(args.name)
+    elif args.command == "list":
+        list_snapshots()
+    else:
+        restore(args.snapshot_dir, args.database_path, args.allow_model_mismatch)
@@ -0,0 +1,36 @@
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app import _build_services
+from config import Config
+
+
+def run_worker(workers: int) -> None:
+    config = Config()
+    config.ensure_runtime_dirs()
+    if workers:
+        config.ingestion_workers = workers
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    _, _, _, job_service = _build_services(config)
+    job_service.start()
+    logging.info("Ingestion worker started with %s threads", job_service.max_workers)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        logging.info("Stopping ingestion worker")
+        job_service.stop(timeout=config.job_lease_seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run ingestion workers outside the API process (set EMBEDDED_WORKERS=false on the API)."
+    )
+    parser.add_argument("--workers", type=int, default=0, help="Worker threads (default: INGESTION_WORKERS).")
+    args = parser.parse_args()
+    run_worker(args.workers)
@@ -0,0 +1,36 @@
+import logging
+import threading
+from typing import Optional
+
+
+class PeriodicTask:
+    """Runs ``tick`` on a background thread every ``interval_seconds`` until stopped."""
+
+    def __init__(self, interval_seconds: float, thread_name: str):
+        self.interval_seconds = interval_seconds
+        self._thread_name = thread_name
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def tick(self) -> None:
+        raise NotImplementedError
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name=self._thread_name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                self.tick()
+            except Exception:
+                logging.exception("%s failed", self._thread_name)
@@ -0,0 +1,310 @@
+import json
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.storage import CHUNK_LIVE, DEFAULT_COLLECTION
+from utils.text_processing import tokenize_terms
+from utils.vectors import decode_embedding
+
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+# Rough per-term overhead of the postings dicts (key string, tuple, two array headers, max count).
+_POSTINGS_TERM_OVERHEAD_BYTES = 256
+# Rough per-chunk overhead of the chunk id to position dict.
+_POSITION_ENTRY_BYTES = 128
+# Rough cost of one binary-search probe relative to scanning one posting.
+_PROBE_COST_FACTOR = 16
+# Builds of one collection's index are serialized on one of this many locks.
+_BUILD_LOCK_STRIPES = 64
+
+
+def validate_collection_name(name: Optional[str]) -> str:
+    """Return ``name`` (or the default collection when empty) if it is a valid collection name."""
+    name = (name or "").strip() or DEFAULT_COLLECTION
+    if not COLLECTION_NAME_PATTERN.match(name):
+        raise ValueError("Collection names may only contain letters, digits, '.', '_' and '-' (max 64).")
+    return name
+
+
+def top_positions(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` highest ``scores``, best first; ties keep index order."""
+    order = np.arange(len(scores))
+    if len(order) > k:
+        order = np.argpartition(-scores, k - 1)[:k]
+    return order[np.lexsort((order, -scores[order]))]
+
+
+@dataclass(frozen=True)
+class CollectionIndex:
+    """In-memory search index of one collection at one generation.
+
+    Holds the unit-normalized chunk vectors as a single matrix and a postings list per term
+    (ascending positions into that matrix plus term counts, and the term's largest count), so a
+    query touches only this collection's rows and only the postings of its own terms.
+
+    Chunks are never removed: a tombstoned chunk keeps its position and is masked out of
+    ``live``. Newer generations are derived with ``apply_changes``, which shares the
+    over-allocated backing arrays and the chunk id to position map with the version it starts
+    from, so only the newest version of an index may be updated.
+    """
+
+    collection: str
+    generation: int
+    chunk_ids: np.ndarray
+    unit_vectors: np.ndarray
+    live: np.ndarray
+    postings: Dict[str, Tuple[np.ndarray, np.ndarray]]
+    max_term_counts: Dict[str, int]
+    nbytes: int
+    _buffers: Tuple[np.ndarray, np.ndarray, np.ndarray] = field(repr=False)
+    _positions: Dict[int, int] = field(repr=False)
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @classmethod
+    def build(cls, collection: str, generation: int, rows: List[Dict]) -> "CollectionIndex":
+        buffers = (np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=bool))
+        empty = cls(collection, 0, *buffers, {}, {}, 0, buffers, {})
+        return empty.apply_changes(generation, rows)
+
+    def apply_changes(self, generation: int, rows: List[Dict]) -> "CollectionIndex":
+        """This index at ``generation``, after the chunk changes in ``rows``.
+
+        ``rows`` are as returned by ``StorageService.get_chunk_changes``; rows without a
+        ``state`` are live. Tombstoned chunks are masked out in place, newly live ones are
+        appended, and chunks already applied are skipped, so replaying a change is harmless.
+        """
+        ids_buffer, vectors_buffer, live_buffer = self._buffers
+        added = [row for row in rows if row.get("state", CHUNK_LIVE) == CHUNK_LIVE and row["id"] not in self._positions]
+        # Decode everything before touching the shared buffers, so a bad row leaves them intact.
+        vectors = np.array([decode_embedding(row) for row in added], dtype=np.float32)
+        if added:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        added_term_counts = [
+            json.loads(row["term_counts"]) if row.get("term_counts") else Counter(tokenize_terms(row["chunk_text"]))
+            for row in added
+        ]
+
+        for row in rows:
+            position = self._positions.get(row["id"])
+            if position is not None and row.get("state", CHUNK_LIVE) != CHUNK_LIVE:
+                live_buffer[position] = False
+        if not added:
+            return self._with(generation, ids_buffer, vectors_buffer, live_buffer, self.postings, self.max_term_counts)
+
+        size, dimension = len(self), vectors.shape[1]
+        new_size = size + len(added)
+        if new_size > len(ids_buffer) or vectors_buffer.shape[1] != dimension:
+            # Double the capacity, so appending n chunks one at a time costs O(n) copies overall.
+            capacity = max(new_size, 2 * len(ids_buffer))
+            ids_buffer, vectors_buffer, live_buffer = (
+                _grown(ids_buffer[:size], capacity),
+                _grown(vectors_buffer[:size].reshape(size, dimension), capacity),
+                _grown(live_buffer[:size], capacity),
+            )
+        ids_buffer[size:new_size] = [row["id"] for row in added]
+        vectors_buffer[size:new_size] = vectors
+        live_buffer[size:new_size] = True
+        for position, row in enumerate(added, start=size):
+            self._positions[row["id"]] = position
+
+        positions: Dict[str, List[int]] = defaultdict(list)
+        counts: Dict[str, List[int]] = defaultdict(list)
+        for position, term_counts in enumerate(added_term_counts, start=size):
+            for term, count in term_counts.items():
+                positions[term].append(position)
+                counts[term].append(count)
+        postings = dict(self.postings)
+        max_term_counts = dict(self.max_term_counts)
+        for term in positions:
+            term_positions = np.array(positions[term], dtype=np.int32)
+            term_counts = np.array(counts[term], dtype=np.int32)
+            if term in postings:
+                # Appended positions follow all existing ones, so the postings stay sorted.
+                term_positions = np.concatenate((postings[term][0], term_positions))
+                term_counts = np.concatenate((postings[term][1], term_counts))
+            postings[term] = (term_positions, term_counts)
+            max_term_counts[term] = max(max_term_counts.get(term, 0), max(counts[term]))
+        return self._with(generation, ids_buffer, vectors_buffer, live_buffer, postings, max_term_counts, new_size)
+
+    def _with(self, generation, ids_buffer, vectors_buffer, live_buffer, postings, max_term_counts, size=None):
+        size = len(self) if size is None else size
+        nbytes = ids_buffer.nbytes + vectors_buffer.nbytes + live_buffer.nbytes
+        nbytes += len(self._positions) * _POSITION_ENTRY_BYTES
+        nbytes += sum(p.nbytes + c.nbytes + _POSTINGS_TERM_OVERHEAD_BYTES for p, c in postings.values())
+        return CollectionIndex(
+            self.collection,
+            generation,
+            ids_buffer[:size],
+            vectors_buffer[:size],
+            live_buffer[:size],
+            postings,
+            max_term_counts,
+            nbytes,
+            (ids_buffer, vectors_buffer, live_buffer),
+            self._positions,
+        )
+
+    def semantic_scores(self, query_vector: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every chunk to ``query_vector``."""
+        return self.unit_vectors @ (query_vector / (np.linalg.norm(query_vector) + 1e-12))
+
+    def lexical_scores(self, query_terms: List[str], positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """Share of query terms (with multiplicity) found in every chunk, or only in the chunks at ``positions``.
+
+        Tombstoned chunks are scored too; callers pick live positions.
+        """
+        size = len(self) if positions is None else len(positions)
+        scores = np.zeros(size, dtype=np.float32)
+        if not query_terms:
+            return scores
+        for term, query_count in Counter(query_terms).items():
+            if term not in self.postings:
+                continue
+            term_positions, counts = self.postings[term]
+            if positions is None:
+                scores[term_positions] += np.minimum(counts, query_count)
+            else:
+                found, indexes = _lookup(term_positions, positions)
+                scores[found] += np.minimum(counts[indexes], query_count)
+        return scores / (len(query_terms) + 1e-12)
+
+    def top_lexical(self, query_terms: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions and scores of the ``k`` best live lexical matches, with MaxScore-style early termination.
+
+        Query terms are visited in descending order of their best possible contribution. Once
+        the k-th best partial score beats everything the unvisited terms could still add, chunks
+        not seen so far can no longer reach the top k. From then on, long postings are only
+        probed for the surviving candidates, by binary search, instead of being scanned, and
+        candidates that fall out of reach are dropped as the bound shrinks.
+        """
+        if not query_terms or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        # Scores are integer overlaps divided by the query length, so work on the overlaps.
+        terms = [
+            (term, query_count, min(self.max_term_counts[term], query_count))
+            for term, query_count in Counter(query_terms).items()
+            if term in self.postings
+        ]
+        # Shorter lists first among equal bounds, so the threshold rises on the cheapest postings.
+        terms.sort(key=lambda item: (-item[2], len(self.postings[item[0]][0])))
+        remaining = sum(upper_bound for _, _, upper_bound in terms)
+        visited = 0
+
+        overlaps = np.zeros(len(self), dtype=np.int32)
+        candidates: Optional[np.ndarray] = None
+        for term, query_count, upper_bound in terms:
+            term_positions, counts = self.postings[term]
+            # Probing is O(candidates * log(postings)); for short postings a scan is cheaper.
+            if candidates is None or len(candidates) * _PROBE_COST_FACTOR >= len(term_positions):
+                # Tombstoned chunks gain nothing, so they can neither be returned nor raise the threshold.
+                overlaps[term_positions] += np.minimum(counts, query_count) * self.live[term_positions]
+            else:
+                found, indexes = _lookup(term_positions, candidates)
+                overlaps[candidates[found]] += np.minimum(counts[indexes], query_count) * self.live[candidates[found]]
+            remaining -= upper_bound
+            visited += upper_bound
+            # No partial score can exceed the visited bounds, so until they outweigh the rest
+            # the threshold cannot rule anything out and is not worth computing.
+            if candidates is None and visited <= remaining:
+                continue
+
+            threshold = _kth_largest(overlaps if candidates is None else overlaps[candidates], k)
+            if candidates is None and threshold > remaining:
+                candidates = np.flatnonzero(overlaps + remaining >= threshold)
+            elif candidates is not None:
+                candidates = candidates[overlaps[candidates] + remaining >= threshold]
+
+        pool = np.flatnonzero(overlaps) if candidates is None else candidates
+        best = pool[top_positions(overlaps[pool], k)]
+        return best, (overlaps[best] / (len(query_terms) + 1e-12)).astype(np.float32)
+
+
+def _grown(array: np.ndarray, capacity: int) -> np.ndarray:
+    """``array`` copied into the start of a zeroed array with room for ``capacity`` rows."""
+    grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+def _kth_largest(values: np.ndarray, k: int) -> int:
+    """The ``k``-th largest of small non-negative integers, by counting; 0 if there are fewer than ``k``."""
+    if len(values) < k:
+        return 0
+    at_least = np.cumsum(np.bincount(values)[::-1])
+    return int(len(at_least) - 1 - np.searchsorted(at_least, k))
+
+
+def _lookup(sorted_positions: np.ndarray, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Which of ``positions`` occur in ``sorted_positions``, and where (as two aligned index arrays)."""
+    if not len(sorted_positions):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    indexes = np.minimum(np.searchsorted(sorted_positions, positions), len(sorted_positions) - 1)
+    found = np.flatnonzero(sorted_positions[indexes] == positions)
+    return found, indexes[found]
+
+
+class CollectionIndexCache:
+    """Keeps the most recently searched collection indexes resident within a memory budget.
+
+    Cold collections are evicted least-recently-used first; they stay on disk in SQLite and are
+    reloaded on their next query. An index larger than the whole budget is used for the query
+    that loaded it but never retained, so a budget of 0 disables residency altogether.
+
+    A resident index is brought up to date by applying the chunks made live or tombstoned since
+    its generation; it is only rebuilt from scratch after compaction removed rows. Only one
+    thread at a time builds or updates a given collection's index; the others wait for it.
+    """
+
+    def __init__(self, memory_budget_bytes: int):
+        self.memory_budget_bytes = max(memory_budget_bytes, 0)
+        self._entries: "OrderedDict[Tuple[str, str], CollectionIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = [threading.Lock() for _ in range(_BUILD_LOCK_STRIPES)]
+
+    def get(self, storage_service, collection: str, generation: int) -> CollectionIndex:
+        key = (storage_service.database_path, collection)
+        index = self._fresh_entry(key, generation)
+        if index is not None:
+            return index
+
+        with self._build_locks[hash(key) % _BUILD_LOCK_STRIPES]:
+            # Another thread may have brought the index up to date while this one waited.
+            index = self._fresh_entry(key, generation)
+            if index is not None:
+                return index
+            with self._lock:
+                index = self._entries.get(key)
+            changes = None if index is None else storage_service.get_chunk_changes(collection, index.generation)
+            if changes is None:
+                index = CollectionIndex.build(collection, generation, storage_service.get_chunk_scoring_rows(collection))
+            else:
+                index = index.apply_changes(generation, changes)
+            with self._lock:
+                self._entries[key] = index
+                self._entries.move_to_end(key)
+                while self._entries and self.resident_bytes > self.memory_budget_bytes:
+                    self._entries.popitem(last=False)
+        return index
+
+    def _fresh_entry(self, key: Tuple[str, str], generation: int) -> Optional[CollectionIndex]:
+        with self._lock:
+            index = self._entries.get(key)
+            if index is None or index.generation < generation:
+                return None
+            self._entries.move_to_end(key)
+            return index
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(index.nbytes for index in self._entries.values())
+
+    def resident(self, database_path: str) -> Dict[str, CollectionIndex]:
+        """Resident indexes of the database at ``database_path``, by collection name."""
+        with self._lock:
+            return {collection: index for (path, collection), index in self._entries.items() if path == database_path}
@@ -0,0 +1,49 @@
+import logging
+import time
+from typing import Dict, Optional
+
+from services.background import PeriodicTask
+
+
+class CompactionTask(PeriodicTask):
+    """Background compaction of tombstoned chunks and deleted documents.
+
+    Deletes and replacements only flip tombstone state, so they are cheap and never block
+    search. Once the tombstoned share of chunk rows reaches ``threshold``, the rows are
+    removed for good and, with ``vacuum``, the SQLite file is rewritten to reclaim space.
+    Documents left pending by a crashed ingestion (their job no longer holds a live lease, or,
+    without a job, no write for ``pending_grace_seconds``) and chunks left without a document
+    are removed on the next pass regardless of the threshold.
+    """
+
+    def __init__(
+        self,
+        storage_service,
+        threshold: float = 0.2,
+        interval_seconds: float = 300.0,
+        vacuum: bool = True,
+        pending_grace_seconds: float = 60.0,
+    ):
+        super().__init__(interval_seconds, "index-compaction")
+        self.storage_service = storage_service
+        self.threshold = threshold
+        self.vacuum = vacuum
+        self.pending_grace_seconds = pending_grace_seconds
+
+    def tick(self) -> None:
+        self.compact_if_needed()
+
+    def compact_if_needed(self) -> Optional[Dict[str, int]]:
+        now = time.time()
+        pending_before = now - self.pending_grace_seconds
+        stats = self.storage_service.tombstone_stats(now, pending_before)
+        below_threshold = not stats["tombstoned"] or stats["tombstoned"] < stats["total"] * self.threshold
+        if below_threshold and not stats["abandoned"] and not stats["orphaned"]:
+            return None
+        result = self.storage_service.compact(vacuum=self.vacuum, now=now, pending_before=pending_before)
+        logging.info(
+            "Compacted index: removed %s chunks and %s documents",
+            result["chunks_removed"],
+            result["documents_removed"],
+        )
+        return result
@@ -1,56 +1,173 @@
+import io
 import json
+import shutil
+from collections import Counter
 from datetime import datetime, timezone
+from itertools import islice
 from pathlib import Path
-from typing import Dict
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from utils.files import extract_text_from_bytes, sanitize_filename
-from utils.text_processing import chunk_text, normalize_text
+from services.storage import CHUNK_PENDING, DEFAULT_COLLECTION
+from utils.files import iter_text_from_stream, sanitize_filename
+from utils.text_processing import iter_chunk_spans, iter_words, snippet_for_chunk, tokenize_terms
+from utils.vectors import vector_to_bytes
+
+TOKEN_COUNT_BATCH_SIZE = 1024
 
 
 class IngestService:
-    def __init__(self, storage_service, embedder, uploads_dir: str, max_chunk_size: int, chunk_overlap: int):
+    def __init__(
+        self,
+        storage_service,
+        embedder,
+        uploads_dir: str,
+        max_chunk_size: int,
+        chunk_overlap: int,
+        batch_size: int = 64,
+        max_chunk_tokens: Optional[int] = None,
+        chunk_overlap_tokens: int = 32,
+    ):
         self.storage_service = storage_service
         self.embedder = embedder
         self.uploads_dir = Path(uploads_dir)
         self.max_chunk_size = max_chunk_size
         self.chunk_overlap = chunk_overlap
+        self.batch_size = max(batch_size, 1)
         self.uploads_dir.mkdir(parents=True, exist_ok=True)
 
-    def ingest_document(self, filename: str, payload: bytes) -> Dict:
+        # Embedders that expose their tokenizer get chunks sized in model tokens, so no chunk is
+        # silently truncated at the model's input limit. Others fall back to word windows.
+        self.token_aware = callable(getattr(embedder, "count_tokens", None))
+        if self.token_aware:
+            model_limit = embedder.max_input_tokens
+            self.chunk_budget = min(max_chunk_tokens, model_limit) if max_chunk_tokens else model_limit
+            self.chunk_overlap_budget = chunk_overlap_tokens
+        else:
+            self.chunk_budget = max_chunk_size
+            self.chunk_overlap_budget = chunk_overlap
+
+    def ingest_document(self, filename: str, payload: bytes, collection: str = DEFAULT_COLLECTION) -> Dict:
+        return self.ingest_stream(filename, io.BytesIO(payload), collection=collection)
+
+    def ingest_stream(
+        self,
+        filename: str,
+        stream: BinaryIO,
+        replaces_document_id: Optional[int] = None,
+        collection: str = DEFAULT_COLLECTION,
+        job_id: Optional[str] = None,
+        lease_owner: Optional[str] = None,
+    ) -> Dict:
+        """Extract, chunk, embed and persist a document in fixed-size chunk batches.
+
+        Memory is bounded by one extraction unit (text block or page) plus ``batch_size``
+        chunks and their vectors, regardless of document size. Content is persisted as one
+        compressed block per batch and chunks reference it by character offset.
+
+        Chunks stay pending (unsearchable) until the whole document is indexed. With
+        ``replaces_document_id`` the new version is staged and then swapped in atomically,
+        keeping the document id; the replaced document must belong to ``collection``.
+
+        When run for ``job_id``, the document is only published while ``lease_owner`` still holds
+        the job's lease; a worker that lost it discards its copy and raises ``StaleIngestionError``.
+        """
         clean_name = sanitize_filename(filename)
         if not clean_name:
             raise ValueError("Invalid filename.")
 
-        content = normalize_text(extract_text_from_bytes(clean_name, payload))
-        if not content:
-            raise ValueError("Uploaded file does not contain extractable text.")
+        pending_words: List[str] = []
 
-        file_path = self.uploads_dir / clean_name
-        file_path.write_bytes(payload)
+        def tracked_words() -> Iterator[str]:
+            for word in iter_words(iter_text_from_stream(clean_name, stream)):
+                pending_words.append(word)
+                yield word
 
-        uploaded_at = datetime.now(timezone.utc).isoformat()
-        document_id = self.storage_service.insert_document(clean_name, content, uploaded_at)
-
-        chunks = chunk_text(content, max_chunk_size=self.max_chunk_size, overlap=self.chunk_overlap)
-        if not chunks:
-            raise ValueError("Document text is too short to index.")
-
-        vectors = self.embedder.encode(chunks)
-        self.storage_service.insert_chunks(
-            document_id,
-            [
-                {
-                    "chunk_index": index,
-                    "chunk_text": chunk,
-                    "embedding": json.dumps(vector.tolist()),
-                }
-                for index, (chunk, vector) in enumerate(zip(chunks, vectors))
-            ],
+        chunks = iter_chunk_spans(
+            self._sized_words(tracked_words()), max_size=self.chunk_budget, overlap=self.chunk_overlap_budget
         )
+        uploaded_at = datetime.now(timezone.utc).isoformat()
+        document_id = None
+        chunks_indexed = 0
+        content_length = 0
+        try:
+            while True:
+                batch = list(islice(chunks, self.batch_size))
+                if not batch:
+                    break
+                if document_id is None:
+                    document_id = self.storage_service.insert_document(
+                        clean_name, "", uploaded_at, collection, pending=True, job_id=job_id
+                    )
+                vectors = self.embedder.encode([chunk["text"] for chunk in batch])
+                # Content blocks are written before the chunks that point into them.
+                content_length = self._flush_content(document_id, pending_words, content_length)
+                self.storage_service.insert_chunks(
+                    document_id,
+                    [
+                        {
+                            "chunk_index": chunks_indexed + offset,
+                            "chunk_text": "",
+                            "embedding_vector": vector_to_bytes(vector),
+                            "start_offset": chunk["start_offset"],
+                            "end_offset": chunk["end_offset"],
+                            "token_count": chunk["size"] if self.token_aware else None,
+                            "snippet": snippet_for_chunk(chunk["text"]),
+                            "term_counts": json.dumps(Counter(tokenize_terms(chunk["text"]))),
+                        }
+                        for offset, (chunk, vector) in enumerate(zip(batch, vectors))
+                    ],
+                    state=CHUNK_PENDING,
+                )
+                chunks_indexed += len(batch)
+            if document_id is not None:
+                self._flush_content(document_id, pending_words, content_length)
+                if replaces_document_id is None:
+                    self.storage_service.activate_document(document_id, lease_owner)
+                elif self.storage_service.replace_document(
+                    replaces_document_id, document_id, clean_name, uploaded_at, lease_owner
+                ):
+                    document_id = replaces_document_id
+                else:
+                    raise ValueError("Document not found.")
+        except Exception:
+            if document_id is not None:
+                self.storage_service.delete_document(document_id)
+            raise
+
+        if document_id is None:
+            raise ValueError("Uploaded file does not contain extractable text.")
+
+        stream.seek(0)
+        with (self.uploads_dir / clean_name).open("wb") as file_handle:
+            shutil.copyfileobj(stream, file_handle)
 
         return {
             "document_id": document_id,
+            "collection": collection,
             "filename": clean_name,
-            "chunks_indexed": len(chunks),
+            "chunks_indexed": chunks_indexed,
             "uploaded_at": uploaded_at,
         }
+
+    def _sized_words(self, words: Iterable[str]) -> Iterator[Tuple[str, int]]:
+        if not self.token_aware:
+            for word in words:
+                yield word, 1
+            return
+        iterator = iter(words)
+        while True:
+            batch = list(islice(iterator, TOKEN_COUNT_BATCH_SIZE))
+            if not batch:
+                return
+            yield from zip(batch, self.embedder.count_tokens(batch))
+
+    def _flush_content(self, document_id: int, pending_words: List[str], content_length: int) -> int:
+        """Write buffered words as the next compressed content block; returns the new content length."""
+        if not pending_words:
+            return content_length
+        text = " ".join(pending_words)
+        if content_length:
+            text = f" {text}"
+        self.storage_service.append_document_block(document_id, content_length, text)
+        pending_words.clear()
+        return content_length + len(text)
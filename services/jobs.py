@@ -1,56 +1,364 @@
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+import socket
+import threading
+import time
+from collections import deque
 from datetime import datetime, timezone
-from typing import Dict, Optional
+from pathlib import Path
+from typing import BinaryIO, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 from uuid import uuid4
 
+from services.storage import DEFAULT_COLLECTION
+
+LANE_SMALL = "small"
+LANE_LARGE = "large"
+LANE_PRIORITIES = {LANE_SMALL: 0, LANE_LARGE: 1}
+TERMINAL_STATUSES = frozenset({"completed", "failed", "cancelled"})
+
+# Relative extraction cost per byte; PDFs and DOCX files are far slower to parse than plain text.
+_EXTRACTION_COST = {".txt": 1, ".docx": 2, ".pdf": 4}
+
 
 class JobService:
-    """Asynchronous ingestion jobs with persistent status tracking."""
+    """Durable ingestion queue backed by the ``jobs`` table and spooled payload files.
 
-    def __init__(self, storage_service, ingest_service, max_workers: int = 2):
+    Workers lease jobs from SQLite and heartbeat while processing, so jobs orphaned by a
+    crashed process are picked up again once their lease expires. Because all state lives
+    in the database and the spool directory, workers can also run in a separate process
+    (see ``scripts/worker.py``).
+    """
+
+    def __init__(
+        self,
+        storage_service,
+        ingest_service,
+        max_workers: int = 2,
+        spool_dir: str = "data/spool",
+        max_attempts: int = 3,
+        retry_backoff_seconds: float = 2.0,
+        lease_seconds: float = 60.0,
+        heartbeat_seconds: float = 15.0,
+        poll_interval_seconds: float = 1.0,
+        small_job_max_bytes: int = 1024 * 1024,
+        collection_max_workers: int = 0,
+        collection_worker_quotas: Optional[Dict[str, int]] = None,
+    ):
         self.storage_service = storage_service
         self.ingest_service = ingest_service
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_workers = max(max_workers, 1)
+        self.spool_dir = Path(spool_dir)
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.small_job_max_bytes = small_job_max_bytes
+        self.collection_max_workers = max(collection_max_workers, 0)
+        self.collection_worker_quotas = dict(collection_worker_quotas or {})
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+
+        self._instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._active_leases: Dict[str, str] = {}
+        self._leases_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+        # In-process change feed used by long-polling and event streams. Only recent job ids are
+        # kept; waiters whose position fell off the window simply re-read their jobs.
+        self._job_changes = threading.Condition()
+        self._change_seq = 0
+        self._recent_changes: Deque[Tuple[int, str]] = deque(maxlen=1024)
 
     @staticmethod
     def _now_iso() -> str:
         return datetime.now(timezone.utc).isoformat()
 
-    def create_ingestion_job(self, filename: str, payload: bytes) -> Dict:
+    def _lane_for(self, filename: str, payload_size: int) -> str:
+        cost = payload_size * _EXTRACTION_COST.get(Path(filename).suffix.lower(), 1)
+        return LANE_SMALL if cost <= self.small_job_max_bytes else LANE_LARGE
+
+    def _worker_lanes(self, worker_index: int) -> Sequence[str]:
+        # With more than one worker, the first is reserved for small jobs so a queue of large
+        # PDFs can never starve quick uploads.
+        if worker_index == 0 and self.max_workers > 1:
+            return (LANE_SMALL,)
+        return (LANE_SMALL, LANE_LARGE)
+
+    def create_ingestion_job(
+        self,
+        filename: str,
+        stream: BinaryIO,
+        replaces_document_id: Optional[int] = None,
+        collection: str = DEFAULT_COLLECTION,
+    ) -> Dict:
         created_at = self._now_iso()
         job_id = str(uuid4())
+        payload_path = self.spool_dir / f"{job_id}{Path(filename).suffix.lower()}"
+        with payload_path.open("wb") as spool_file:
+            shutil.copyfileobj(stream, spool_file)
+            payload_size = spool_file.tell()
+
+        lane = self._lane_for(filename, payload_size)
         job = {
             "id": job_id,
             "filename": filename,
             "status": "queued",
             "document_id": None,
+            "replaces_document_id": replaces_document_id,
+            "collection": collection,
             "error_message": None,
+            "lane": lane,
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
             "created_at": created_at,
             "updated_at": created_at,
         }
-        self.storage_service.insert_job(job)
-        self.executor.submit(self._run_ingestion_job, job_id, filename, payload)
+        self.storage_service.insert_job(
+            {
+                **job,
+                "priority": LANE_PRIORITIES[lane],
+                "payload_path": str(payload_path),
+                "payload_size": payload_size,
+                "available_at": time.time(),
+            }
+        )
+        with self._condition:
+            self._condition.notify_all()
+        self._publish_job_change(job_id)
         return job
 
-    def _run_ingestion_job(self, job_id: str, filename: str, payload: bytes) -> None:
-        self.storage_service.update_job(job_id=job_id, status="processing", updated_at=self._now_iso())
-        try:
-            result = self.ingest_service.ingest_document(filename, payload)
-            self.storage_service.update_job(
-                job_id=job_id,
-                status="completed",
-                updated_at=self._now_iso(),
-                document_id=result["document_id"],
+    def cancel_job(self, job_id: str) -> Optional[Dict]:
+        """Cancel a queued job. Returns ``None`` if the job is running or already finished."""
+        cancelled = self.storage_service.cancel_job(job_id, updated_at=self._now_iso())
+        if not cancelled:
+            return None
+        self._discard_payload(cancelled["payload_path"])
+        self._publish_job_change(job_id)
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        return self.storage_service.get_job(job_id)
+
+    def get_jobs(self, job_ids: Sequence[str]) -> List[Dict]:
+        return self.storage_service.get_jobs(job_ids)
+
+    def wait_for_job(self, job_id: str, timeout: float) -> Optional[Dict]:
+        """Long-poll: return the job once it changes state or finishes, or after ``timeout``."""
+        deadline = time.monotonic() + timeout
+        seq = self._current_change_seq()
+        job = self.get_job(job_id)
+        if not job or job["status"] in TERMINAL_STATUSES:
+            return job
+        initial = (job["status"], job["updated_at"])
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            seq = self._wait_for_changes({job_id}, seq, min(remaining, self.poll_interval_seconds))
+            job = self.get_job(job_id) or job
+            if (job["status"], job["updated_at"]) != initial:
+                return job
+
+    def iter_job_events(self, job_ids: Iterable[str], timeout: float) -> Iterator[Optional[Dict]]:
+        """Yield each job's current state, then every subsequent change until all are finished.
+
+        ``None`` is yielded whenever a wait elapses without changes so callers can emit keep-alives.
+        Jobs running in another worker process are picked up by re-reading every poll interval.
+        """
+        watched = set(job_ids)
+        deadline = time.monotonic() + timeout
+        seq = self._current_change_seq()
+        last_seen: Dict[str, Tuple[str, str]] = {}
+        while True:
+            changed = False
+            jobs = self.get_jobs(list(watched))
+            watched.intersection_update(job["id"] for job in jobs)
+            for job in jobs:
+                state = (job["status"], job["updated_at"])
+                if last_seen.get(job["id"]) != state:
+                    last_seen[job["id"]] = state
+                    changed = True
+                    yield job
+                if job["status"] in TERMINAL_STATUSES:
+                    watched.discard(job["id"])
+            if not watched:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if not changed:
+                yield None
+            seq = self._wait_for_changes(watched, seq, min(remaining, self.poll_interval_seconds))
+
+    def _current_change_seq(self) -> int:
+        with self._job_changes:
+            return self._change_seq
+
+    def _publish_job_change(self, job_id: str) -> None:
+        with self._job_changes:
+            self._change_seq += 1
+            self._recent_changes.append((self._change_seq, job_id))
+            self._job_changes.notify_all()
+
+    def _wait_for_changes(self, job_ids: Set[str], since_seq: int, timeout: float) -> int:
+        """Block until one of ``job_ids`` changes after ``since_seq``; returns the latest sequence."""
+
+        def has_changes() -> bool:
+            if self._change_seq == since_seq:
+                return False
+            if not self._recent_changes or self._recent_changes[0][0] > since_seq + 1:
+                return True
+            return any(seq > since_seq and job_id in job_ids for seq, job_id in self._recent_changes)
+
+        with self._job_changes:
+            self._job_changes.wait_for(has_changes, timeout)
+            return self._change_seq
+
+    def start(self) -> None:
+        """Start worker and heartbeat threads in this process."""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for worker_index in range(self.max_workers):
+            self._threads.append(
+                threading.Thread(
+                    target=self._worker_loop,
+                    args=(f"{self._instance_id}:{worker_index}", self._worker_lanes(worker_index)),
+                    name=f"ingestion-worker-{worker_index}",
+                    daemon=True,
+                )
             )
+        self._threads.append(threading.Thread(target=self._heartbeat_loop, name="ingestion-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_pending(self, lanes: Sequence[str] = (LANE_SMALL, LANE_LARGE)) -> int:
+        """Process runnable jobs synchronously until the queue is drained; returns the count."""
+        processed = 0
+        while self._process_next(f"{self._instance_id}:sync", lanes):
+            processed += 1
+        return processed
+
+    def _worker_loop(self, owner: str, lanes: Sequence[str]) -> None:
+        while not self._stop_event.is_set():
+            try:
+                if self._process_next(owner, lanes):
+                    continue
+            except Exception:
+                logging.exception("Ingestion worker failed to poll the job queue")
+            with self._condition:
+                self._condition.wait(self.poll_interval_seconds)
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop_event.wait(self.heartbeat_seconds):
+            with self._leases_lock:
+                leases = list(self._active_leases.items())
+            for job_id, owner in leases:
+                try:
+                    self.storage_service.renew_job_lease(job_id, owner, time.time() + self.lease_seconds)
+                except Exception:
+                    logging.exception("Failed to renew lease for job %s", job_id)
+
+    def _process_next(self, owner: str, lanes: Sequence[str]) -> bool:
+        job = self.storage_service.claim_job(
+            owner,
+            lanes,
+            now=time.time(),
+            lease_seconds=self.lease_seconds,
+            updated_at=self._now_iso(),
+            collection_max_workers=self.collection_max_workers,
+            collection_worker_quotas=self.collection_worker_quotas,
+        )
+        if not job:
+            return False
+        with self._leases_lock:
+            self._active_leases[job["id"]] = owner
+        self._publish_job_change(job["id"])
+        try:
+            self._run_ingestion_job(job, owner)
+        finally:
+            with self._leases_lock:
+                self._active_leases.pop(job["id"], None)
+            self._publish_job_change(job["id"])
+            # A freed lease may unblock jobs held back by their collection's worker quota.
+            with self._condition:
+                self._condition.notify_all()
+        return True
+
+    def _run_ingestion_job(self, job: Dict, owner: str) -> None:
+        job_id = job["id"]
+        payload_path = job.get("payload_path")
+        if job["attempts"] > job["max_attempts"]:
+            self._fail_job(job_id, owner, payload_path, "Job exceeded its retry budget after repeated worker crashes.")
+            return
+        if not payload_path or not Path(payload_path).exists():
+            self._fail_job(job_id, owner, payload_path, "Job payload is no longer available.")
+            return
+
+        try:
+            with open(payload_path, "rb") as stream:
+                result = self.ingest_service.ingest_stream(
+                    job["filename"],
+                    stream,
+                    replaces_document_id=job.get("replaces_document_id"),
+                    collection=job.get("collection") or DEFAULT_COLLECTION,
+                    job_id=job_id,
+                    lease_owner=owner,
+                )
+        except ValueError as exc:
+            # Validation errors are deterministic; retrying would fail the same way.
+            self._fail_job(job_id, owner, payload_path, str(exc))
+            return
         except Exception as exc:
             logging.exception("Ingestion job failed")
-            self.storage_service.update_job(
-                job_id=job_id,
-                status="failed",
-                updated_at=self._now_iso(),
-                error_message=str(exc),
-            )
+            if job["attempts"] < job["max_attempts"]:
+                delay = self.retry_backoff_seconds * (2 ** (job["attempts"] - 1))
+                self.storage_service.release_job(
+                    job_id=job_id,
+                    owner=owner,
+                    status="queued",
+                    updated_at=self._now_iso(),
+                    available_at=time.time() + delay,
+                    error_message=str(exc),
+                )
+            else:
+                self._fail_job(job_id, owner, payload_path, str(exc))
+            return
 
-    def get_job(self, job_id: str) -> Optional[Dict]:
-        return self.storage_service.get_job(job_id)
+        released = self.storage_service.release_job(
+            job_id=job_id,
+            owner=owner,
+            status="completed",
+            updated_at=self._now_iso(),
+            document_id=result["document_id"],
+        )
+        # A worker that lost its lease must leave the payload to the worker that took the job over.
+        if released:
+            self._discard_payload(payload_path)
+
+    def _fail_job(self, job_id: str, owner: str, payload_path: Optional[str], error_message: str) -> None:
+        released = self.storage_service.release_job(
+            job_id=job_id,
+            owner=owner,
+            status="failed",
+            updated_at=self._now_iso(),
+            error_message=error_message,
+        )
+        if released:
+            self._discard_payload(payload_path)
+
+    @staticmethod
+    def _discard_payload(payload_path: Optional[str]) -> None:
+        if payload_path:
+            Path(payload_path).unlink(missing_ok=True)
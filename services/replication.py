@@ -0,0 +1,139 @@
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from services.background import PeriodicTask
+from services.snapshot import SnapshotService, restore_snapshot
+from services.storage import StorageService
+
+ROLE_COMBINED = "combined"
+ROLE_INDEXER = "indexer"
+ROLE_SEARCHER = "searcher"
+ROLES = (ROLE_COMBINED, ROLE_INDEXER, ROLE_SEARCHER)
+
+CURRENT_POINTER = "CURRENT"
+GENERATION_PREFIX = "gen-"
+
+
+def read_current_generation(publish_dir: str) -> Optional[str]:
+    pointer = Path(publish_dir) / CURRENT_POINTER
+    if not pointer.exists():
+        return None
+    return pointer.read_text(encoding="utf-8").strip() or None
+
+
+def _generation_number(name: Optional[str]) -> int:
+    if not name or not name.startswith(GENERATION_PREFIX):
+        return 0
+    return int(name[len(GENERATION_PREFIX) :])
+
+
+class IndexPublisher(PeriodicTask):
+    """Indexer side: publishes the index as immutable, numbered generations in a shared directory.
+
+    Each generation is a snapshot directory (``gen-000001``...). The ``CURRENT`` pointer file is
+    replaced atomically once a generation is complete, so searchers never see a partial one.
+    """
+
+    def __init__(
+        self,
+        storage_service: StorageService,
+        publish_dir: str,
+        model_name: str,
+        interval_seconds: float = 30.0,
+        keep_generations: int = 3,
+    ):
+        super().__init__(interval_seconds, "index-publisher")
+        self.storage_service = storage_service
+        self.publish_dir = Path(publish_dir)
+        self.keep_generations = max(keep_generations, 1)
+        self.snapshot_service = SnapshotService(storage_service, str(self.publish_dir), model_name)
+        self._published_fingerprint = None
+
+    def tick(self) -> None:
+        self.publish_if_changed()
+
+    def publish_if_changed(self) -> Optional[Dict]:
+        fingerprint = self.storage_service.index_fingerprint()
+        if fingerprint == self._published_fingerprint:
+            return None
+        current = read_current_generation(str(self.publish_dir))
+        name = f"{GENERATION_PREFIX}{_generation_number(current) + 1:06d}"
+        manifest = self.snapshot_service.create_snapshot(name)
+
+        pointer_tmp = self.publish_dir / f".{CURRENT_POINTER}.{os.getpid()}.tmp"
+        pointer_tmp.write_text(name, encoding="utf-8")
+        os.replace(pointer_tmp, self.publish_dir / CURRENT_POINTER)
+        self._published_fingerprint = fingerprint
+        logging.info("Published index generation %s", name)
+        self._prune(name)
+        return manifest
+
+    def _prune(self, current: str) -> None:
+        generations = sorted(path for path in self.publish_dir.glob(f"{GENERATION_PREFIX}*") if path.is_dir())
+        for path in generations[: -self.keep_generations]:
+            if path.name != current:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+class IndexSubscriber(PeriodicTask):
+    """Searcher side: follows ``CURRENT`` and atomically switches search to new generations.
+
+    A new generation is bulk-restored into a private SQLite file, then swapped into the search
+    service with a single reference assignment. The previous generation's file is kept until
+    the next switch so queries already running against it can finish.
+    """
+
+    def __init__(
+        self,
+        search_service,
+        publish_dir: str,
+        local_dir: str,
+        model_name: str,
+        interval_seconds: float = 5.0,
+    ):
+        super().__init__(interval_seconds, "index-subscriber")
+        self.search_service = search_service
+        self.publish_dir = Path(publish_dir)
+        self.local_dir = Path(local_dir)
+        self.model_name = model_name
+        self.generation: Optional[str] = None
+        self.local_dir.mkdir(parents=True, exist_ok=True)
+        self._refresh_lock = threading.Lock()
+
+    def tick(self) -> None:
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Load the published generation if it is newer than the one being served."""
+        with self._refresh_lock:
+            latest = read_current_generation(str(self.publish_dir))
+            if not latest or latest == self.generation:
+                return False
+            database_path = self.local_dir / f"{latest}.db"
+            # Leftovers from an interrupted restore are never served, so they can be discarded.
+            self._remove_database(database_path)
+            try:
+                restore_snapshot(str(self.publish_dir / latest), str(database_path), expected_model=self.model_name)
+            except Exception:
+                self._remove_database(database_path)
+                raise
+
+            self.search_service.storage_service = StorageService(str(database_path))
+            previous, self.generation = self.generation, latest
+            logging.info("Switched search to index generation %s", latest)
+            self._prune(keep={latest, previous})
+            return True
+
+    def _prune(self, keep) -> None:
+        for path in self.local_dir.glob(f"{GENERATION_PREFIX}*.db"):
+            if path.stem not in keep:
+                self._remove_database(path)
+
+    @staticmethod
+    def _remove_database(path: Path) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
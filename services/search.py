@@ -1,53 +1,288 @@
+import base64
+import hashlib
 import json
-from collections import Counter
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from functools import lru_cache
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
-from utils.text_processing import snippet_for_chunk
+from services.collections import CollectionIndexCache, top_positions
+from services.storage import DEFAULT_COLLECTION
+from utils.text_processing import snippet_for_chunk, tokenize_terms
+
+RESULT_FETCH_BATCH_SIZE = 10
+
+FUSION_WEIGHTED = "weighted"
+FUSION_RRF = "rrf"
+FUSION_NORMALIZED = "normalized"
+FUSION_MODES = (FUSION_WEIGHTED, FUSION_RRF, FUSION_NORMALIZED)
 
 
 class SentenceTransformerEmbedder:
     def __init__(self, model_name: str):
         self.model = SentenceTransformer(model_name)
 
+    @property
+    def max_input_tokens(self) -> int:
+        """Word-piece budget per input, excluding the [CLS]/[SEP] special tokens."""
+        return self.model.max_seq_length - 2
+
+    def count_tokens(self, words: List[str]) -> List[int]:
+        encoded = self.model.tokenizer(words, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
     def encode(self, texts: List[str]) -> np.ndarray:
         return np.array(self.model.encode(texts, convert_to_numpy=True))
 
 
+class CursorExpiredError(Exception):
+    """The ranking a pagination cursor refers to is gone and the index has changed since."""
+
+
+@dataclass(frozen=True)
+class Ranking:
+    """Ranked candidates for one query against one index generation, best first."""
+
+    key: str
+    query: str
+    collection: str
+    fusion: str
+    min_score: float
+    chunk_ids: np.ndarray
+    scores: np.ndarray
+    semantic_scores: np.ndarray
+    lexical_scores: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+
+def encode_cursor(ranking_key: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{ranking_key}:{offset}".encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        key, offset = decoded.split(":")
+        offset = int(offset)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.") from None
+    if not key or offset < 0:
+        raise ValueError("Invalid cursor.")
+    return key, offset
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """Fuse best-first position lists: each list adds ``1 / (k + rank)`` to the positions it contains."""
+    positions = np.concatenate([np.asarray(ranked, dtype=np.int64) for ranked in rankings])
+    contributions = np.concatenate([1.0 / (k + np.arange(1, len(ranked) + 1)) for ranked in rankings])
+    fused_positions, inverse = np.unique(positions, return_inverse=True)
+    return fused_positions, np.bincount(inverse, weights=contributions).astype(np.float32)
+
+
+def normalized_score_fusion(
+    rankings: List[Tuple[np.ndarray, np.ndarray]], weights: List[float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fuse ``(positions, scores)`` lists by a weighted sum of their min-max normalized scores."""
+    positions = np.concatenate([np.asarray(ranked, dtype=np.int64) for ranked, _ in rankings])
+    contributions = []
+    for (_, scores), weight in zip(rankings, weights):
+        spread = float(scores.max() - scores.min()) if len(scores) else 0.0
+        normalized = (scores - scores.min()) / spread if spread > 0 else np.ones(len(scores))
+        contributions.append(normalized * weight)
+    fused_positions, inverse = np.unique(positions, return_inverse=True)
+    return fused_positions, np.bincount(inverse, weights=np.concatenate(contributions)).astype(np.float32)
+
+
 class SearchService:
-    def __init__(self, storage_service, embedder):
+    def __init__(
+        self,
+        storage_service,
+        embedder,
+        ranking_cache_size: int = 128,
+        memory_budget_bytes: int = 512 * 1024 * 1024,
+    ):
         self.storage_service = storage_service
         self.embedder = embedder
-
-    @staticmethod
-    def _cosine_similarity(query_vector: np.ndarray, vectors: np.ndarray) -> np.ndarray:
-        query_norm = np.linalg.norm(query_vector) + 1e-12
-        vectors_norm = np.linalg.norm(vectors, axis=1) + 1e-12
-        return np.dot(vectors, query_vector) / (vectors_norm * query_norm)
-
-    @staticmethod
-    def _tokenize(text: str) -> List[str]:
-        return [token for token in text.lower().split() if token]
-
-    def _lexical_scores(self, query: str, chunks: List[dict]) -> np.ndarray:
-        query_terms = self._tokenize(query)
-        if not query_terms:
-            return np.zeros(len(chunks), dtype=np.float32)
-        query_counter = Counter(query_terms)
-        scores = []
-        for chunk in chunks:
-            chunk_terms = Counter(self._tokenize(chunk["chunk_text"]))
-            overlap = sum(min(chunk_terms[term], query_counter[term]) for term in query_counter)
-            scores.append(float(overlap) / (len(query_terms) + 1e-12))
-        return np.array(scores, dtype=np.float32)
+        self.ranking_cache_size = max(ranking_cache_size, 1)
+        self.index_cache = CollectionIndexCache(memory_budget_bytes)
+        self._rankings: "OrderedDict[str, Ranking]" = OrderedDict()
+        self._rankings_lock = threading.Lock()
 
     @lru_cache(maxsize=128)
     def _cached_query_embedding(self, query: str) -> np.ndarray:
         return self.embedder.encode([query])[0]
 
+    def rank(
+        self,
+        query: str,
+        min_score: float = 0.1,
+        semantic_weight: float = 0.75,
+        lexical_weight: float = 0.25,
+        depth: int = 30,
+        collection: str = DEFAULT_COLLECTION,
+        *,
+        fusion: str = FUSION_WEIGHTED,
+        semantic_candidates: int = 200,
+        lexical_candidates: int = 200,
+        rrf_k: int = 60,
+    ) -> Ranking:
+        """Rank ``collection`` for ``query`` and keep the best ``depth`` chunks at or above ``min_score``.
+
+        ``weighted`` scores every chunk with both retrievers and sorts on the weighted sum. The
+        fusion modes (``rrf``, ``normalized``) instead take the top ``semantic_candidates`` and
+        ``lexical_candidates`` from each retriever independently, fuse the two lists, and score
+        only the fused set exactly; ``min_score`` then applies to that exact weighted score.
+
+        Rankings are cached per collection generation, so paging through one only scores the
+        collection once. Other collections are never read.
+        """
+        if fusion not in FUSION_MODES:
+            raise ValueError(f"Unknown fusion mode '{fusion}'. Expected one of: {', '.join(FUSION_MODES)}.")
+        depth = max(depth, 1)
+        # Searchers may switch index generations mid-request; stay on one storage for the whole query.
+        storage_service = self.storage_service
+        generation = storage_service.index_generation(collection)
+        options = [min_score, semantic_weight, lexical_weight, depth, fusion]
+        if fusion != FUSION_WEIGHTED:
+            options += [semantic_candidates, lexical_candidates, rrf_k]
+        key = self._ranking_key(storage_service, collection, generation, query, *options)
+        ranking = self.cached_ranking(key)
+        if ranking is not None:
+            return ranking
+
+        index = self.index_cache.get(storage_service, collection, generation)
+        query_terms = tokenize_terms(query)
+        live_positions = np.flatnonzero(index.live)
+        if not len(live_positions):
+            positions = np.zeros(0, dtype=np.int64)
+            semantic_scores = lexical_scores = rank_scores = np.zeros(0, dtype=np.float32)
+        elif fusion == FUSION_WEIGHTED:
+            positions = live_positions
+            semantic_scores = index.semantic_scores(self._cached_query_embedding(query))[positions]
+            lexical_scores = index.lexical_scores(query_terms)[positions]
+            rank_scores = (semantic_scores * semantic_weight) + (lexical_scores * lexical_weight)
+        else:
+            # Exact nearest neighbours score every chunk anyway; keep the scores for the fused set.
+            all_semantic_scores = index.semantic_scores(self._cached_query_embedding(query))
+            live_top = top_positions(all_semantic_scores[live_positions], max(semantic_candidates, 1))
+            semantic_positions = live_positions[live_top]
+            semantic_top = (semantic_positions, all_semantic_scores[semantic_positions])
+            lexical_top = index.top_lexical(query_terms, lexical_candidates)
+            if fusion == FUSION_RRF:
+                positions, rank_scores = reciprocal_rank_fusion([semantic_top[0], lexical_top[0]], rrf_k)
+            else:
+                positions, rank_scores = normalized_score_fusion(
+                    [semantic_top, lexical_top], [semantic_weight, lexical_weight]
+                )
+            semantic_scores = all_semantic_scores[positions]
+            lexical_scores = index.lexical_scores(query_terms, positions)
+
+        exact_scores = (semantic_scores * semantic_weight) + (lexical_scores * lexical_weight)
+        order = top_positions(rank_scores, depth)
+        order = order[exact_scores[order] >= min_score]
+
+        ranking = Ranking(
+            key=key,
+            query=query,
+            collection=collection,
+            fusion=fusion,
+            min_score=min_score,
+            chunk_ids=index.chunk_ids[positions[order]],
+            scores=rank_scores[order],
+            semantic_scores=semantic_scores[order],
+            lexical_scores=lexical_scores[order],
+        )
+        with self._rankings_lock:
+            self._rankings[key] = ranking
+            while len(self._rankings) > self.ranking_cache_size:
+                self._rankings.popitem(last=False)
+        return ranking
+
+    def clear_ranking_cache(self) -> None:
+        with self._rankings_lock:
+            self._rankings.clear()
+
+    def cached_ranking(self, key: str) -> Optional[Ranking]:
+        with self._rankings_lock:
+            ranking = self._rankings.get(key)
+            if ranking is not None:
+                self._rankings.move_to_end(key)
+            return ranking
+
+    @staticmethod
+    def _ranking_key(storage_service, collection: str, generation: int, query: str, *options) -> str:
+        payload = json.dumps([storage_service.database_path, collection, generation, query, *options])
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:20]
+
+    def iter_results(self, ranking: Ranking, offset: int = 0, limit: int = 10) -> Iterator[dict]:
+        """Yield result dicts for ``ranking[offset:offset + limit]``, fetching display fields in small batches.
+
+        Chunks deleted since the ranking was computed are skipped.
+        """
+        storage_service = self.storage_service
+        end = min(offset + limit, len(ranking))
+        for batch_start in range(offset, end, RESULT_FETCH_BATCH_SIZE):
+            positions = range(batch_start, min(batch_start + RESULT_FETCH_BATCH_SIZE, end))
+            ids = [int(ranking.chunk_ids[position]) for position in positions]
+            details = {row["id"]: row for row in storage_service.get_chunks_by_ids(ids)}
+            for position, chunk_id in zip(positions, ids):
+                detail = details.get(chunk_id)
+                if detail is None:
+                    continue
+                yield {
+                    "document_id": detail["document_id"],
+                    "filename": detail["filename"],
+                    "chunk_index": detail["chunk_index"],
+                    "score": round(float(ranking.scores[position]), 4),
+                    "semantic_score": round(float(ranking.semantic_scores[position]), 4),
+                    "lexical_score": round(float(ranking.lexical_scores[position]), 4),
+                    "snippet": detail["snippet"] or snippet_for_chunk(detail["chunk_text"]),
+                }
+
+    def search_page(
+        self,
+        query: str,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        min_score: float = 0.1,
+        semantic_weight: float = 0.75,
+        lexical_weight: float = 0.25,
+        depth: int = 1000,
+        collection: str = DEFAULT_COLLECTION,
+        **fusion_options,
+    ) -> Tuple[Iterator[dict], Optional[str]]:
+        """Return one page of results and the cursor for the next page (``None`` on the last page).
+
+        A cursor pins the ranking it was issued from, so later pages stay consistent with the
+        first one even after the index changes, for as long as that ranking remains cached. It is
+        only valid for the query, collection, fusion mode and ``min_score`` it was issued for.
+        """
+        if cursor:
+            key, offset = decode_cursor(cursor)
+            ranking = self.cached_ranking(key)
+            if ranking is None:
+                ranking = self.rank(
+                    query, min_score, semantic_weight, lexical_weight, depth, collection, **fusion_options
+                )
+                if ranking.key != key:
+                    raise CursorExpiredError("Cursor has expired; repeat the search without a cursor.")
+            if (ranking.query, ranking.collection) != (query, collection):
+                raise ValueError("Cursor does not belong to this query.")
+            if (ranking.fusion, ranking.min_score) != (fusion_options.get("fusion", FUSION_WEIGHTED), min_score):
+                raise ValueError("Cursor was issued for different search options.")
+        else:
+            offset = 0
+            ranking = self.rank(query, min_score, semantic_weight, lexical_weight, depth, collection, **fusion_options)
+        next_offset = offset + limit
+        next_cursor = encode_cursor(ranking.key, next_offset) if next_offset < len(ranking) else None
+        return self.iter_results(ranking, offset, limit), next_cursor
+
     def hybrid_search(
         self,
         query: str,
@@ -56,46 +291,13 @@ class SearchService:
         semantic_weight: float = 0.75,
         lexical_weight: float = 0.25,
         rerank_top_k: int = 30,
+        collection: str = DEFAULT_COLLECTION,
+        **fusion_options,
     ) -> List[dict]:
-        chunks = self.storage_service.get_all_chunks()
-        if not chunks:
-            return []
-
-        query_vector = self._cached_query_embedding(query)
-        chunk_vectors = np.array([json.loads(item["embedding"]) for item in chunks], dtype=np.float32)
-        semantic_scores = self._cosine_similarity(query_vector, chunk_vectors)
-        lexical_scores = self._lexical_scores(query, chunks)
-        combined_scores = (semantic_scores * semantic_weight) + (lexical_scores * lexical_weight)
-
-        ranked = sorted(
-            zip(chunks, combined_scores, semantic_scores, lexical_scores),
-            key=lambda item: float(item[1]),
-            reverse=True,
-        )[:rerank_top_k]
-        reranked = sorted(
-            ranked,
-            key=lambda item: float(item[1]),
-            reverse=True,
+        ranking = self.rank(
+            query, min_score, semantic_weight, lexical_weight, rerank_top_k, collection, **fusion_options
         )
-
-        results = []
-        for chunk, score, semantic_score, lexical_score in reranked:
-            if float(score) < min_score:
-                continue
-            results.append(
-                {
-                    "document_id": chunk["document_id"],
-                    "filename": chunk["filename"],
-                    "chunk_index": chunk["chunk_index"],
-                    "score": round(float(score), 4),
-                    "semantic_score": round(float(semantic_score), 4),
-                    "lexical_score": round(float(lexical_score), 4),
-                    "snippet": snippet_for_chunk(chunk["chunk_text"]),
-                }
-            )
-            if len(results) >= limit:
-                break
-        return results
+        return list(self.iter_results(ranking, 0, limit))
 
     def semantic_search(self, query: str, limit: int = 10, min_score: float = 0.1) -> List[dict]:
         return self.hybrid_search(query=query, limit=limit, min_score=min_score)
@@ -0,0 +1,189 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+from services.storage import CHUNK_LIVE, DEFAULT_COLLECTION, SNAPSHOT_COLUMNS, StorageService
+from utils.vectors import decode_embedding, vector_to_bytes
+
+SNAPSHOT_FORMAT_VERSION = 3
+# Version 1 predates tombstones and version 2 predates collections; their rows restore as live,
+# non-deleted rows in the default collection.
+READABLE_FORMAT_VERSIONS = (1, 2, 3)
+MANIFEST_FILENAME = "manifest.json"
+VECTORS_FILENAME = "vectors.npy"
+SNAPSHOT_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+TABLE_FILENAMES = {
+    "documents": "documents.jsonl",
+    "document_blocks": "blocks.jsonl",
+    "chunks": "chunks.jsonl",
+}
+
+
+class SnapshotService:
+    """Exports consistent, versioned index snapshots; ``restore_snapshot`` bulk-loads them.
+
+    A snapshot directory holds the chunk vectors as one ``.npy`` matrix (row ``i`` belongs to
+    line ``i`` of ``chunks.jsonl``), document/chunk metadata including lexical term counts as
+    JSON lines, the compressed content blocks, and a manifest with the model name, vector
+    dimension, row counts, and file checksums. Restoring never calls the embedding model.
+    """
+
+    def __init__(self, storage_service: StorageService, snapshots_dir: str, model_name: str):
+        self.storage_service = storage_service
+        self.snapshots_dir = Path(snapshots_dir)
+        self.model_name = model_name
+
+    def create_snapshot(self, name: Optional[str] = None) -> Dict:
+        created_at = datetime.now(timezone.utc)
+        name = name or f"snapshot-{created_at.strftime('%Y%m%dT%H%M%S%fZ')}"
+        if not SNAPSHOT_NAME_PATTERN.match(name):
+            raise ValueError("Snapshot names may only contain letters, digits, '.', '_' and '-'.")
+        target = self.snapshots_dir / name
+        if target.exists():
+            raise ValueError(f"Snapshot '{name}' already exists.")
+        staging = self.snapshots_dir / f".{name}.{uuid4().hex[:8]}.tmp"
+        staging.mkdir(parents=True)
+        try:
+            manifest = self._write_snapshot(staging, name, created_at.isoformat())
+            # Publishing by rename means readers never observe a half-written snapshot.
+            os.replace(staging, target)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return manifest
+
+    def list_snapshots(self) -> List[Dict]:
+        if not self.snapshots_dir.exists():
+            return []
+        manifests = []
+        for manifest_path in sorted(self.snapshots_dir.glob(f"*/{MANIFEST_FILENAME}")):
+            if manifest_path.parent.name.startswith("."):
+                continue
+            manifests.append(json.loads(manifest_path.read_text(encoding="utf-8")))
+        return manifests
+
+    def _write_snapshot(self, directory: Path, name: str, created_at: str) -> Dict:
+        counts = {}
+        dimension = None
+        with self.storage_service.snapshot_reader() as conn:
+            for table in ("documents", "document_blocks"):
+                with (directory / TABLE_FILENAMES[table]).open("w", encoding="utf-8") as handle:
+                    counts[table] = 0
+                    for row in self.storage_service.iter_snapshot_rows(conn, table):
+                        if table == "document_blocks":
+                            row["data"] = base64.b64encode(row["data"]).decode("ascii")
+                        handle.write(json.dumps(row) + "\n")
+                        counts[table] += 1
+
+            counts["chunks"] = self.storage_service.count_snapshot_rows(conn, "chunks")
+            vectors = None
+            with (directory / TABLE_FILENAMES["chunks"]).open("w", encoding="utf-8") as handle:
+                for index, row in enumerate(self.storage_service.iter_snapshot_rows(conn, "chunks")):
+                    vector = decode_embedding(row)
+                    if vectors is None:
+                        dimension = int(vector.shape[0])
+                        vectors = np.lib.format.open_memmap(
+                            directory / VECTORS_FILENAME,
+                            mode="w+",
+                            dtype=np.float32,
+                            shape=(counts["chunks"], dimension),
+                        )
+                    vectors[index] = vector
+                    row.pop("embedding")
+                    row.pop("embedding_vector")
+                    handle.write(json.dumps(row) + "\n")
+            if vectors is None:
+                np.save(directory / VECTORS_FILENAME, np.zeros((0, 0), dtype=np.float32))
+            else:
+                vectors.flush()
+                del vectors
+
+        manifest = {
+            "name": name,
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "created_at": created_at,
+            "model_name": self.model_name,
+            "dimension": dimension,
+            "counts": counts,
+            "files": {
+                filename: _sha256(directory / filename)
+                for filename in (VECTORS_FILENAME, *TABLE_FILENAMES.values())
+            },
+        }
+        (directory / MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        return manifest
+
+
+def load_manifest(snapshot_dir: str) -> Dict:
+    manifest_path = Path(snapshot_dir) / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        raise ValueError(f"No snapshot manifest found in {snapshot_dir}.")
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    if manifest.get("format_version") not in READABLE_FORMAT_VERSIONS:
+        raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}.")
+    return manifest
+
+
+def restore_snapshot(snapshot_dir: str, database_path: str, expected_model: Optional[str] = None) -> Dict:
+    """Bulk-load a snapshot into a fresh database at ``database_path`` without re-embedding."""
+    directory = Path(snapshot_dir)
+    manifest = load_manifest(snapshot_dir)
+    if expected_model and manifest["model_name"] != expected_model:
+        raise ValueError(
+            f"Snapshot was built with model '{manifest['model_name']}', expected '{expected_model}'."
+        )
+    for filename, checksum in manifest["files"].items():
+        if _sha256(directory / filename) != checksum:
+            raise ValueError(f"Snapshot file {filename} is corrupt (checksum mismatch).")
+
+    Path(database_path).parent.mkdir(parents=True, exist_ok=True)
+    storage = StorageService(database_path)
+    vectors = np.load(directory / VECTORS_FILENAME, mmap_mode="r")
+    storage.bulk_load(
+        {
+            "documents": _table_rows(directory, "documents"),
+            "document_blocks": _table_rows(directory, "document_blocks"),
+            "chunks": _chunk_rows(directory, vectors),
+        }
+    )
+    return manifest
+
+
+def _read_jsonl(path: Path) -> Iterator[Dict]:
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            yield json.loads(line)
+
+
+def _table_rows(directory: Path, table: str) -> Iterator[Tuple]:
+    for row in _read_jsonl(directory / TABLE_FILENAMES[table]):
+        if table == "document_blocks":
+            row["data"] = base64.b64decode(row["data"])
+        elif table == "documents":
+            row.setdefault("collection", DEFAULT_COLLECTION)
+        yield tuple(row.get(column) for column in SNAPSHOT_COLUMNS[table])
+
+
+def _chunk_rows(directory: Path, vectors: np.ndarray) -> Iterator[Tuple]:
+    for index, row in enumerate(_read_jsonl(directory / TABLE_FILENAMES["chunks"])):
+        row["embedding"] = ""
+        row["embedding_vector"] = vector_to_bytes(vectors[index])
+        row.setdefault("state", CHUNK_LIVE)
+        yield tuple(row[column] for column in SNAPSHOT_COLUMNS["chunks"])
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -1,6 +1,116 @@
+import json
 import sqlite3
+import time
+import zlib
+from collections import defaultdict
 from contextlib import contextmanager
-from typing import Dict, Generator, List, Optional
+from typing import Dict, Generator, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+TEXT_COMPRESSION_LEVEL = 6
+DEFAULT_COLLECTION = "default"
+
+# Per-chunk state; search only scores live chunks, so this column acts as the tombstone bitmap.
+CHUNK_LIVE = 0
+CHUNK_PENDING = 1
+CHUNK_TOMBSTONED = 2
+
+JOB_PUBLIC_COLUMNS = (
+    "id",
+    "filename",
+    "status",
+    "document_id",
+    "replaces_document_id",
+    "collection",
+    "error_message",
+    "lane",
+    "attempts",
+    "max_attempts",
+    "created_at",
+    "updated_at",
+)
+
+# Columns added after the initial schema; older databases are migrated in place.
+_JOB_QUEUE_COLUMNS = {
+    "priority": "INTEGER NOT NULL DEFAULT 0",
+    "lane": "TEXT NOT NULL DEFAULT 'small'",
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "max_attempts": "INTEGER NOT NULL DEFAULT 3",
+    "payload_path": "TEXT",
+    "payload_size": "INTEGER",
+    "available_at": "REAL NOT NULL DEFAULT 0",
+    "lease_owner": "TEXT",
+    "lease_expires_at": "REAL",
+    "replaces_document_id": "INTEGER",
+    "collection": f"TEXT NOT NULL DEFAULT '{DEFAULT_COLLECTION}'",
+}
+_DOCUMENT_COLUMNS = {
+    "deleted_at": "TEXT",
+    "collection": f"TEXT NOT NULL DEFAULT '{DEFAULT_COLLECTION}'",
+    # Unix time of the last write by the ingestion still building the document; NULL once it is live.
+    "pending_heartbeat": "REAL",
+    # Ingestion job building a pending document; only that job's current lease holder may publish it.
+    "job_id": "TEXT",
+}
+# Documents that are neither deleted nor still being ingested (or staged for a replacement).
+_VISIBLE_DOCUMENT = "deleted_at IS NULL AND pending_heartbeat IS NULL"
+# A pending document the given lease owner may publish: still there, and its job (if any) still theirs.
+_PUBLISHABLE_DOCUMENT = """
+    id = ? AND pending_heartbeat IS NOT NULL
+    AND (job_id IS NULL OR EXISTS (
+        SELECT 1 FROM jobs WHERE jobs.id = documents.job_id AND jobs.lease_owner = ? AND jobs.status = 'processing'
+    ))
+"""
+# A pending document no live ingestion is working on (parameters: now, pending_before, now). One
+# built by a job is abandoned once that job is no longer processing under a live lease; one built
+# without a job has no lease to check and is abandoned once it has not been written since
+# ``pending_before``.
+_ABANDONED_DOCUMENT = """
+    ? IS NOT NULL AND pending_heartbeat IS NOT NULL
+    AND CASE WHEN job_id IS NULL THEN pending_heartbeat < ?
+        ELSE NOT EXISTS (
+            SELECT 1 FROM jobs
+            WHERE jobs.id = documents.job_id AND jobs.status = 'processing' AND jobs.lease_expires_at > ?
+        )
+    END
+"""
+_CHUNK_COLUMNS = {
+    "start_offset": "INTEGER",
+    "end_offset": "INTEGER",
+    "token_count": "INTEGER",
+    "snippet": "TEXT",
+    "term_counts": "TEXT",
+    "embedding_vector": "BLOB",
+    "state": f"INTEGER NOT NULL DEFAULT {CHUNK_LIVE}",
+    # Collection generation in which the chunk last became live or tombstoned, for incremental index updates.
+    "state_generation": "INTEGER",
+}
+_COLLECTION_COLUMNS = {
+    # Generation at which compaction last removed rows; resident indexes older than it are rebuilt.
+    "rebuild_generation": "INTEGER NOT NULL DEFAULT 0",
+}
+# Column order shared by snapshot export and bulk restore.
+SNAPSHOT_COLUMNS = {
+    "documents": ("id", "filename", "content", "uploaded_at", "deleted_at", "collection"),
+    "document_blocks": ("document_id", "start_offset", "end_offset", "data"),
+    "chunks": (
+        "id",
+        "document_id",
+        "chunk_index",
+        "chunk_text",
+        "embedding",
+        "embedding_vector",
+        "start_offset",
+        "end_offset",
+        "token_count",
+        "snippet",
+        "term_counts",
+        "state",
+    ),
+}
+
+
+class StaleIngestionError(Exception):
+    """A pending document can no longer be published: it was removed, or its job's lease was lost."""
 
 
 class StorageService:
@@ -22,6 +132,7 @@ class StorageService:
 
     def _init_db(self) -> None:
         with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS documents (
@@ -57,55 +168,498 @@ class StorageService:
                 )
                 """
             )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS document_blocks (
+                    document_id INTEGER NOT NULL,
+                    start_offset INTEGER NOT NULL,
+                    end_offset INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (document_id, start_offset),
+                    FOREIGN KEY(document_id) REFERENCES documents(id)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS collections (
+                    name TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            self._add_missing_columns(conn, "jobs", _JOB_QUEUE_COLUMNS)
+            self._add_missing_columns(conn, "documents", _DOCUMENT_COLUMNS)
+            self._add_missing_columns(conn, "chunks", _CHUNK_COLUMNS)
+            self._add_missing_columns(conn, "collections", _COLLECTION_COLUMNS)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority, available_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks (document_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_collection ON documents (collection)")
+            conn.execute("INSERT OR IGNORE INTO collections (name) SELECT DISTINCT collection FROM documents")
+
+    @staticmethod
+    def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, str]) -> None:
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, definition in columns.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
-    def insert_document(self, filename: str, content: str, uploaded_at: str) -> int:
+    @staticmethod
+    def _bump_index_generation(conn: sqlite3.Connection, document_id: int) -> int:
+        """Bump the generation of ``document_id``'s collection and return the new value."""
+        conn.execute(
+            """
+            INSERT INTO collections (name, generation)
+            SELECT collection, 1 FROM documents WHERE id = ?
+            ON CONFLICT (name) DO UPDATE SET generation = generation + 1
+            """,
+            (document_id,),
+        )
+        row = conn.execute(
+            "SELECT c.generation FROM collections c JOIN documents d ON d.collection = c.name WHERE d.id = ?",
+            (document_id,),
+        ).fetchone()
+        return int(row[0])
+
+    def index_generation(self, collection: str = DEFAULT_COLLECTION) -> int:
+        """Per-collection counter bumped in every transaction that changes which chunks are searchable."""
+        with self._connection() as conn:
+            row = conn.execute("SELECT generation FROM collections WHERE name = ?", (collection,)).fetchone()
+            return int(row[0]) if row else 0
+
+    def list_collections(self) -> List[Dict]:
+        with self._connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT c.name, COUNT(d.id) AS documents
+                FROM collections c
+                LEFT JOIN documents d ON d.collection = c.name AND d.deleted_at IS NULL AND d.pending_heartbeat IS NULL
+                GROUP BY c.name
+                ORDER BY c.name
+                """
+            ).fetchall()
+            return [dict(row) for row in rows]
+
+    def insert_document(
+        self,
+        filename: str,
+        content: str,
+        uploaded_at: str,
+        collection: str = DEFAULT_COLLECTION,
+        pending: bool = False,
+        job_id: Optional[str] = None,
+    ) -> int:
+        """Insert a document row; a ``pending`` one stays hidden until activated or swapped in.
+
+        ``job_id`` ties a pending document to the ingestion job building it.
+        """
         with self._connection() as conn:
             cur = conn.execute(
-                "INSERT INTO documents (filename, content, uploaded_at) VALUES (?, ?, ?)",
-                (filename, content, uploaded_at),
+                """
+                INSERT INTO documents (filename, content, uploaded_at, collection, pending_heartbeat, job_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (filename, content, uploaded_at, collection, time.time() if pending else None, job_id),
             )
             return int(cur.lastrowid)
 
-    def insert_chunks(self, document_id: int, chunks_with_embeddings: List[Dict[str, str]]) -> None:
+    def append_document_block(self, document_id: int, start_offset: int, text: str) -> None:
+        """Store the next slice of a document's content as a zlib-compressed block.
+
+        Documents stored this way keep an empty ``content`` column; their text, and the text of
+        their chunks, is reconstructed from blocks by character offset.
+        """
         with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO document_blocks (document_id, start_offset, end_offset, data) VALUES (?, ?, ?, ?)",
+                (
+                    document_id,
+                    start_offset,
+                    start_offset + len(text),
+                    zlib.compress(text.encode("utf-8"), TEXT_COMPRESSION_LEVEL),
+                ),
+            )
+
+    @staticmethod
+    def _read_document_range(
+        conn: sqlite3.Connection, document_id: int, start: int = 0, end: Optional[int] = None
+    ) -> Tuple[str, int]:
+        """Decompress the blocks overlapping ``[start, end)``; returns the text and its base offset."""
+        rows = conn.execute(
+            """
+            SELECT start_offset, data FROM document_blocks
+            WHERE document_id = ? AND end_offset > ? AND (? IS NULL OR start_offset < ?)
+            ORDER BY start_offset
+            """,
+            (document_id, start, end, end),
+        ).fetchall()
+        if not rows:
+            return "", start
+        text = "".join(zlib.decompress(row["data"]).decode("utf-8") for row in rows)
+        return text, rows[0]["start_offset"]
+
+    def _fill_chunk_texts(self, conn: sqlite3.Connection, chunks: List[Dict]) -> None:
+        """Populate ``chunk_text`` for chunks stored by offset, reading each document's blocks once."""
+        by_document: Dict[int, List[Dict]] = defaultdict(list)
+        for chunk in chunks:
+            if not chunk["chunk_text"] and chunk.get("end_offset") is not None:
+                by_document[chunk["document_id"]].append(chunk)
+        for document_id, document_chunks in by_document.items():
+            start = min(chunk["start_offset"] for chunk in document_chunks)
+            end = max(chunk["end_offset"] for chunk in document_chunks)
+            text, base = self._read_document_range(conn, document_id, start, end)
+            for chunk in document_chunks:
+                chunk["chunk_text"] = text[chunk["start_offset"] - base : chunk["end_offset"] - base]
+
+    def delete_document(self, document_id: int) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+            conn.execute("DELETE FROM document_blocks WHERE document_id = ?", (document_id,))
+            conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+
+    def tombstone_document(self, document_id: int, deleted_at: str, collection: Optional[str] = None) -> bool:
+        """Soft-delete a document: hide it and tombstone its chunks until the next compaction.
+
+        With ``collection`` set, documents in other collections are treated as missing.
+        """
+        with self._connection() as conn:
+            cur = conn.execute(
+                f"""
+                UPDATE documents SET deleted_at = ?
+                WHERE id = ? AND {_VISIBLE_DOCUMENT} AND (? IS NULL OR collection = ?)
+                """,
+                (deleted_at, document_id, collection, collection),
+            )
+            if not cur.rowcount:
+                return False
+            generation = self._bump_index_generation(conn, document_id)
+            conn.execute(
+                "UPDATE chunks SET state = ?, state_generation = ? WHERE document_id = ? AND state != ?",
+                (CHUNK_TOMBSTONED, generation, document_id, CHUNK_TOMBSTONED),
+            )
+            return True
+
+    def activate_document(self, document_id: int, lease_owner: Optional[str] = None) -> None:
+        """Make a fully ingested document visible and its pending chunks searchable.
+
+        Raises ``StaleIngestionError`` if the pending document is gone or its job is no longer
+        leased by ``lease_owner``; nothing is published then.
+        """
+        with self._connection() as conn:
+            cur = conn.execute(
+                f"UPDATE documents SET pending_heartbeat = NULL, job_id = NULL WHERE {_PUBLISHABLE_DOCUMENT}",
+                (document_id, lease_owner),
+            )
+            if not cur.rowcount:
+                raise StaleIngestionError(f"Pending document {document_id} can no longer be published.")
+            generation = self._bump_index_generation(conn, document_id)
+            conn.execute(
+                "UPDATE chunks SET state = ?, state_generation = ? WHERE document_id = ? AND state = ?",
+                (CHUNK_LIVE, generation, document_id, CHUNK_PENDING),
+            )
+
+    def replace_document(
+        self,
+        document_id: int,
+        staging_document_id: int,
+        filename: str,
+        uploaded_at: str,
+        lease_owner: Optional[str] = None,
+    ) -> bool:
+        """Atomically swap a staged re-ingestion in for ``document_id``.
+
+        The old chunks are tombstoned, the old content blocks dropped, and the staged chunks and
+        blocks re-pointed at ``document_id`` and made live. Returns ``False`` if the target
+        document no longer exists in the staged document's collection, and raises
+        ``StaleIngestionError`` like ``activate_document`` if the staged document may not be published.
+        """
+        with self._connection() as conn:
+            # Checking the staged document first also takes the write lock for the whole swap.
+            cur = conn.execute(
+                f"UPDATE documents SET job_id = NULL WHERE {_PUBLISHABLE_DOCUMENT}", (staging_document_id, lease_owner)
+            )
+            if not cur.rowcount:
+                raise StaleIngestionError(f"Pending document {staging_document_id} can no longer be published.")
+            cur = conn.execute(
+                f"""
+                UPDATE documents SET filename = ?, uploaded_at = ?, content = ''
+                WHERE id = ? AND {_VISIBLE_DOCUMENT}
+                  AND collection = (SELECT collection FROM documents WHERE id = ?)
+                """,
+                (filename, uploaded_at, document_id, staging_document_id),
+            )
+            if not cur.rowcount:
+                return False
+            generation = self._bump_index_generation(conn, document_id)
+            conn.execute(
+                "UPDATE chunks SET state = ?, state_generation = ? WHERE document_id = ? AND state != ?",
+                (CHUNK_TOMBSTONED, generation, document_id, CHUNK_TOMBSTONED),
+            )
+            conn.execute("DELETE FROM document_blocks WHERE document_id = ?", (document_id,))
+            conn.execute(
+                "UPDATE chunks SET document_id = ?, state = ?, state_generation = ? WHERE document_id = ?",
+                (document_id, CHUNK_LIVE, generation, staging_document_id),
+            )
+            conn.execute(
+                "UPDATE document_blocks SET document_id = ? WHERE document_id = ?",
+                (document_id, staging_document_id),
+            )
+            conn.execute("DELETE FROM documents WHERE id = ?", (staging_document_id,))
+            return True
+
+    def tombstone_stats(self, now: Optional[float] = None, pending_before: Optional[float] = None) -> Dict[str, int]:
+        """Chunk totals, tombstoned and orphaned chunks, and pending documents abandoned as of ``now``."""
+        with self._connection() as conn:
+            row = conn.execute(
+                f"""
+                SELECT COUNT(*) AS total, COALESCE(SUM(state = ?), 0) AS tombstoned,
+                       COALESCE(SUM(NOT EXISTS (SELECT 1 FROM documents d WHERE d.id = chunks.document_id)), 0)
+                           AS orphaned,
+                       (SELECT COUNT(*) FROM documents WHERE {_ABANDONED_DOCUMENT}) AS abandoned
+                FROM chunks
+                """,
+                (CHUNK_TOMBSTONED, now, pending_before, now),
+            ).fetchone()
+            return dict(row)
+
+    def compact(
+        self, vacuum: bool = True, now: Optional[float] = None, pending_before: Optional[float] = None
+    ) -> Dict[str, int]:
+        """Physically remove tombstoned chunks and deleted documents, then optionally rewrite the file.
+
+        With ``now``, pending documents abandoned by a crashed worker are removed as well: those
+        whose job no longer holds a live lease, or, for ingestions run without a job, whose last
+        write was before ``pending_before``. Chunks left without a document are always removed.
+        """
+        with self._connection() as conn:
+            removed = f"deleted_at IS NOT NULL OR ({_ABANDONED_DOCUMENT})"
+            params = (now, pending_before, now)
+            chunks_removed = conn.execute(
+                f"""
+                DELETE FROM chunks
+                WHERE state = ? OR document_id IN (SELECT id FROM documents WHERE {removed})
+                   OR NOT EXISTS (SELECT 1 FROM documents d WHERE d.id = chunks.document_id)
+                """,
+                (CHUNK_TOMBSTONED, *params),
+            ).rowcount
+            conn.execute(
+                f"""
+                DELETE FROM document_blocks
+                WHERE document_id IN (SELECT id FROM documents WHERE {removed})
+                   OR NOT EXISTS (SELECT 1 FROM documents d WHERE d.id = document_blocks.document_id)
+                """,
+                params,
+            )
+            documents_removed = conn.execute(f"DELETE FROM documents WHERE {removed}", params).rowcount
+            if chunks_removed or documents_removed:
+                # Removed rows can no longer be replayed as changes, so resident indexes are rebuilt.
+                conn.execute("UPDATE collections SET generation = generation + 1, rebuild_generation = generation + 1")
+        if vacuum:
+            conn = sqlite3.connect(self.database_path, isolation_level=None)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        return {"chunks_removed": chunks_removed, "documents_removed": documents_removed}
+
+    def insert_chunks(
+        self, document_id: int, chunks_with_embeddings: List[Dict[str, str]], state: int = CHUNK_LIVE
+    ) -> None:
+        with self._connection() as conn:
+            generation = self._bump_index_generation(conn, document_id) if state == CHUNK_LIVE else None
             conn.executemany(
                 """
-                INSERT INTO chunks (document_id, chunk_index, chunk_text, embedding)
-                VALUES (?, ?, ?, ?)
+                INSERT INTO chunks (
+                    document_id, chunk_index, chunk_text, embedding, embedding_vector,
+                    start_offset, end_offset, token_count, snippet, term_counts, state, state_generation
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 [
                     (
                         document_id,
                         item["chunk_index"],
                         item["chunk_text"],
-                        item["embedding"],
+                        item.get("embedding", ""),
+                        item.get("embedding_vector"),
+                        item.get("start_offset"),
+                        item.get("end_offset"),
+                        item.get("token_count"),
+                        item.get("snippet"),
+                        item.get("term_counts"),
+                        state,
+                        generation,
                     )
                     for item in chunks_with_embeddings
                 ],
             )
+            if state != CHUNK_LIVE:
+                conn.execute(
+                    "UPDATE documents SET pending_heartbeat = ? WHERE id = ? AND pending_heartbeat IS NOT NULL",
+                    (time.time(), document_id),
+                )
 
-    def get_document(self, document_id: int) -> Optional[Dict]:
+    def get_document(self, document_id: int, collection: Optional[str] = None) -> Optional[Dict]:
         with self._connection() as conn:
-            row = conn.execute("SELECT * FROM documents WHERE id = ?", (document_id,)).fetchone()
-            return dict(row) if row else None
+            row = conn.execute(
+                f"""
+                SELECT id, filename, content, uploaded_at, collection FROM documents
+                WHERE id = ? AND {_VISIBLE_DOCUMENT} AND (? IS NULL OR collection = ?)
+                """,
+                (document_id, collection, collection),
+            ).fetchone()
+            if not row:
+                return None
+            document = dict(row)
+            if not document["content"]:
+                document["content"], _ = self._read_document_range(conn, document_id)
+            return document
+
+    def document_exists(self, document_id: int, collection: Optional[str] = None) -> bool:
+        with self._connection() as conn:
+            row = conn.execute(
+                f"SELECT 1 FROM documents WHERE id = ? AND {_VISIBLE_DOCUMENT} AND (? IS NULL OR collection = ?)",
+                (document_id, collection, collection),
+            ).fetchone()
+            return row is not None
 
-    def get_all_chunks(self) -> List[Dict]:
+    def get_chunk_scoring_rows(self, collection: str = DEFAULT_COLLECTION) -> List[Dict]:
+        """Fetch only what ranking needs for one collection: embeddings and lexical term counts, no text.
+
+        Legacy rows ingested before term counts were precomputed also return their text.
+        Pending and tombstoned chunks are masked out.
+        """
         with self._connection() as conn:
             rows = conn.execute(
                 """
-                SELECT c.id, c.document_id, c.chunk_index, c.chunk_text, c.embedding, d.filename
-                FROM chunks c
-                JOIN documents d ON c.document_id = d.id
+                SELECT c.id, c.embedding, c.embedding_vector, c.term_counts,
+                       CASE WHEN c.term_counts IS NULL THEN c.chunk_text END AS chunk_text
+                FROM documents d
+                JOIN chunks c ON c.document_id = d.id
+                WHERE d.collection = ? AND c.state = ?
+                """,
+                (collection, CHUNK_LIVE),
+            ).fetchall()
+            return [dict(row) for row in rows]
+
+    def get_chunk_changes(self, collection: str, since_generation: int) -> Optional[List[Dict]]:
+        """Chunks of ``collection`` made live or tombstoned after ``since_generation``, with their ``state``.
+
+        Live rows carry the same fields as ``get_chunk_scoring_rows``. Returns ``None`` when
+        compaction has removed rows since then, as the changes can no longer be replayed.
+        """
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            row = conn.execute("SELECT rebuild_generation FROM collections WHERE name = ?", (collection,)).fetchone()
+            if row and since_generation < row[0]:
+                return None
+            rows = conn.execute(
                 """
+                SELECT c.id, c.state,
+                       CASE WHEN c.state = :live THEN c.embedding END AS embedding,
+                       CASE WHEN c.state = :live THEN c.embedding_vector END AS embedding_vector,
+                       CASE WHEN c.state = :live THEN c.term_counts END AS term_counts,
+                       CASE WHEN c.state = :live AND c.term_counts IS NULL THEN c.chunk_text END AS chunk_text
+                FROM documents d
+                JOIN chunks c ON c.document_id = d.id
+                WHERE d.collection = :collection AND c.state_generation > :since AND c.state != :pending
+                ORDER BY c.id
+                """,
+                {"live": CHUNK_LIVE, "pending": CHUNK_PENDING, "collection": collection, "since": since_generation},
             ).fetchall()
             return [dict(row) for row in rows]
 
+    def get_chunks_by_ids(self, chunk_ids: Sequence[int]) -> List[Dict]:
+        """Fetch display fields for ranked chunks; text is decompressed only when no snippet is stored.
+
+        Chunks tombstoned since they were ranked are left out.
+        """
+        if not chunk_ids:
+            return []
+        placeholders = ", ".join("?" for _ in chunk_ids)
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT c.id, c.document_id, c.chunk_index, c.start_offset, c.end_offset, c.snippet,
+                       CASE WHEN c.snippet IS NULL THEN c.chunk_text END AS chunk_text, d.filename
+                FROM chunks c
+                JOIN documents d ON c.document_id = d.id
+                WHERE c.id IN ({placeholders}) AND c.state = ?
+                """,
+                (*chunk_ids, CHUNK_LIVE),
+            ).fetchall()
+            chunks = [dict(row) for row in rows]
+            self._fill_chunk_texts(conn, [chunk for chunk in chunks if chunk["snippet"] is None])
+            return chunks
+
+    def index_fingerprint(self) -> Tuple[int, ...]:
+        """Cheap summary of the indexed content; changes whenever documents or chunks change."""
+        with self._connection() as conn:
+            row = conn.execute(
+                """
+                SELECT (SELECT COUNT(*) FROM documents), (SELECT COALESCE(MAX(id), 0) FROM documents),
+                       (SELECT COUNT(*) FROM documents WHERE deleted_at IS NOT NULL),
+                       (SELECT COUNT(*) FROM chunks), (SELECT COALESCE(MAX(id), 0) FROM chunks),
+                       (SELECT COUNT(*) FROM chunks WHERE state = ?)
+                """,
+                (CHUNK_LIVE,),
+            ).fetchone()
+            return tuple(row)
+
+    @contextmanager
+    def snapshot_reader(self) -> Generator[sqlite3.Connection, None, None]:
+        """Connection holding a single read transaction, so multi-table exports are consistent."""
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            yield conn
+
+    @staticmethod
+    def _snapshot_filter(table: str) -> str:
+        """Snapshots leave out documents still being ingested, which a restore could never finish."""
+        if table == "documents":
+            return "pending_heartbeat IS NULL"
+        return "document_id IN (SELECT id FROM documents WHERE pending_heartbeat IS NULL)"
+
+    def count_snapshot_rows(self, conn: sqlite3.Connection, table: str) -> int:
+        return int(conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {self._snapshot_filter(table)}").fetchone()[0])
+
+    def iter_snapshot_rows(self, conn: sqlite3.Connection, table: str) -> Iterator[Dict]:
+        columns = SNAPSHOT_COLUMNS[table]
+        order = "document_id, start_offset" if table == "document_blocks" else "id"
+        query = f"SELECT {', '.join(columns)} FROM {table} WHERE {self._snapshot_filter(table)} ORDER BY {order}"
+        for row in conn.execute(query):
+            yield dict(row)
+
+    def bulk_load(self, tables: Dict[str, Iterable[Tuple]]) -> None:
+        """Insert snapshot rows (tuples in ``SNAPSHOT_COLUMNS`` order) in one transaction."""
+        with self._connection() as conn:
+            for table in ("documents", "document_blocks", "chunks"):
+                if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                    raise ValueError(f"Cannot restore into a non-empty database ({table} has rows).")
+            for table in ("documents", "document_blocks", "chunks"):
+                columns = SNAPSHOT_COLUMNS[table]
+                conn.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    tables.get(table, ()),
+                )
+            conn.execute(
+                """
+                INSERT INTO collections (name, generation, rebuild_generation)
+                SELECT DISTINCT collection, 1, 1 FROM documents WHERE true
+                ON CONFLICT (name) DO UPDATE SET generation = generation + 1, rebuild_generation = generation + 1
+                """
+            )
+
     def insert_job(self, job: Dict) -> None:
         with self._connection() as conn:
             conn.execute(
                 """
-                INSERT INTO jobs (id, filename, status, document_id, error_message, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO jobs (
+                    id, filename, status, document_id, error_message, created_at, updated_at,
+                    priority, lane, attempts, max_attempts, payload_path, payload_size, available_at,
+                    replaces_document_id, collection
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 (
                     job["id"],
@@ -115,28 +669,140 @@ class StorageService:
                     job.get("error_message"),
                     job["created_at"],
                     job["updated_at"],
+                    job.get("priority", 0),
+                    job.get("lane", "small"),
+                    job.get("attempts", 0),
+                    job.get("max_attempts", 3),
+                    job.get("payload_path"),
+                    job.get("payload_size"),
+                    job.get("available_at", 0.0),
+                    job.get("replaces_document_id"),
+                    job.get("collection", DEFAULT_COLLECTION),
+                ),
+            )
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._connection() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_PUBLIC_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            return dict(row) if row else None
+
+    def get_jobs(self, job_ids: Sequence[str]) -> List[Dict]:
+        if not job_ids:
+            return []
+        placeholders = ", ".join("?" for _ in job_ids)
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(JOB_PUBLIC_COLUMNS)} FROM jobs WHERE id IN ({placeholders})",
+                tuple(job_ids),
+            ).fetchall()
+            return [dict(row) for row in rows]
+
+    def claim_job(
+        self,
+        owner: str,
+        lanes: Sequence[str],
+        now: float,
+        lease_seconds: float,
+        updated_at: str,
+        collection_max_workers: int = 0,
+        collection_worker_quotas: Optional[Dict[str, int]] = None,
+    ) -> Optional[Dict]:
+        """Atomically lease the next runnable job in ``lanes``.
+
+        Runnable means queued and past its retry backoff, or processing under a lease that
+        expired because its worker stopped heartbeating. Jobs are skipped while their collection
+        already holds as many live leases as its quota (``collection_worker_quotas``, falling
+        back to ``collection_max_workers``; 0 means unlimited).
+        """
+        placeholders = ", ".join("?" for _ in lanes)
+        quotas = json.dumps(collection_worker_quotas or {})
+        with self._connection() as conn:
+            row = conn.execute(
+                f"""
+                UPDATE jobs
+                SET status = 'processing', attempts = attempts + 1, updated_at = ?,
+                    lease_owner = ?, lease_expires_at = ?
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE lane IN ({placeholders})
+                      AND (
+                        (status = 'queued' AND available_at <= ?)
+                        OR (status = 'processing' AND COALESCE(lease_expires_at, 0) < ?)
+                      )
+                      AND collection NOT IN (
+                        SELECT busy.collection FROM jobs busy
+                        WHERE busy.status = 'processing' AND busy.lease_expires_at >= ?
+                        GROUP BY busy.collection
+                        HAVING COUNT(*) >= NULLIF(
+                            COALESCE((SELECT quota.value FROM json_each(?) quota WHERE quota.key = busy.collection), ?),
+                            0
+                        )
+                      )
+                    ORDER BY priority, available_at, created_at
+                    LIMIT 1
+                )
+                RETURNING *
+                """,
+                (
+                    updated_at,
+                    owner,
+                    now + lease_seconds,
+                    *lanes,
+                    now,
+                    now,
+                    now,
+                    quotas,
+                    collection_max_workers,
                 ),
+            ).fetchone()
+            return dict(row) if row else None
+
+    def renew_job_lease(self, job_id: str, owner: str, lease_expires_at: float) -> bool:
+        with self._connection() as conn:
+            cur = conn.execute(
+                """
+                UPDATE jobs SET lease_expires_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'processing'
+                """,
+                (lease_expires_at, job_id, owner),
             )
+            return cur.rowcount > 0
 
-    def update_job(
+    def release_job(
         self,
         job_id: str,
+        owner: str,
         status: str,
         updated_at: str,
+        available_at: Optional[float] = None,
         document_id: Optional[int] = None,
         error_message: Optional[str] = None,
-    ) -> None:
+    ) -> bool:
+        """Record the outcome of a leased job; a no-op if the lease was lost to another worker."""
         with self._connection() as conn:
-            conn.execute(
+            cur = conn.execute(
                 """
                 UPDATE jobs
-                SET status = ?, updated_at = ?, document_id = COALESCE(?, document_id), error_message = ?
-                WHERE id = ?
+                SET status = ?, updated_at = ?, available_at = COALESCE(?, available_at),
+                    document_id = COALESCE(?, document_id), error_message = ?,
+                    lease_owner = NULL, lease_expires_at = NULL
+                WHERE id = ? AND lease_owner = ? AND status = 'processing'
                 """,
-                (status, updated_at, document_id, error_message, job_id),
+                (status, updated_at, available_at, document_id, error_message, job_id, owner),
             )
+            return cur.rowcount > 0
 
-    def get_job(self, job_id: str) -> Optional[Dict]:
+    def cancel_job(self, job_id: str, updated_at: str) -> Optional[Dict]:
+        """Cancel a job that has not been picked up by a worker yet."""
         with self._connection() as conn:
-            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            row = conn.execute(
+                """
+                UPDATE jobs SET status = 'cancelled', updated_at = ?
+                WHERE id = ? AND status = 'queued'
+                RETURNING payload_path
+                """,
+                (updated_at, job_id),
+            ).fetchone()
             return dict(row) if row else None
@@ -21,12 +21,19 @@ def app(tmp_path):
     config = TestConfig(
         database_path=str(tmp_path / "test.db"),
         uploads_dir=str(tmp_path / "uploads"),
+        jobs_spool_dir=str(tmp_path / "spool"),
+        snapshots_dir=str(tmp_path / "snapshots"),
+        admin_token="test-admin-token",
+        job_poll_interval_seconds=0.05,
         max_chunk_size=50,
         chunk_overlap=10,
         max_search_results=5,
         min_similarity_score=-1.0,
     )
-    return create_app(config=config, embedder=FakeEmbedder())
+    app = create_app(config=config, embedder=FakeEmbedder())
+    yield app
+    app.extensions["job_service"].stop(timeout=1)
+    app.extensions["compaction"].stop(timeout=1)
 
 
 @pytest.fixture()
@@ -16,3 +16,12 @@ class FakeEmbedder:
                 ]
             )
         return np.array(vectors, dtype=np.float32)
+
+
+class FakeTokenizingEmbedder(FakeEmbedder):
+    """Fake embedder exposing a tokenizer: one token per started four characters of a word."""
+
+    max_input_tokens = 8
+
+    def count_tokens(self, words):
+        return [(len(word) + 3) // 4 for word in words]
@@ -1,4 +1,5 @@
 import io
+import json
 import time
 
 
@@ -55,3 +56,162 @@ def test_openapi_contract_available(client):
     assert spec["openapi"].startswith("3.")
     assert "/documents" in spec["paths"]
     assert "/search" in spec["paths"]
+
+
+def _upload(client, name="resume_notes.txt"):
+    response = client.post(
+        "/documents",
+        data={"file": (io.BytesIO(b"python backend semantic search api"), name)},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 202
+    return response.get_json()["id"]
+
+
+def _wait_for_job(client, job_id):
+    job = None
+    for _ in range(5):
+        job = client.get(f"/jobs/{job_id}?wait=2").get_json()
+        if job["status"] in ("completed", "failed"):
+            break
+    return job
+
+
+def test_job_long_poll_returns_finished_job(client):
+    assert _wait_for_job(client, _upload(client))["status"] == "completed"
+
+
+def test_bulk_job_status_and_event_stream(client):
+    first, second = _upload(client, "a.txt"), _upload(client, "b.txt")
+
+    stream = client.get(f"/jobs/events?ids={first},{second}")
+    assert stream.mimetype == "text/event-stream"
+    body = stream.get_data(as_text=True)
+    assert body.rstrip().endswith("event: end\ndata: {}")
+    assert '"status": "completed"' in body
+
+    response = client.get(f"/jobs?ids={first},{second},missing-id")
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert {job["status"] for job in payload["jobs"]} == {"completed"}
+    assert payload["missing"] == ["missing-id"]
+    assert client.get("/jobs").status_code == 400
+
+
+def test_admin_snapshot_export(client):
+    assert client.post("/admin/snapshots").status_code == 401
+    assert client.post("/admin/snapshots", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert client.post("/admin/snapshots", headers={"X-Admin-Token": "tést"}).status_code == 401
+
+    headers = {"X-Admin-Token": "test-admin-token"}
+    response = client.post("/admin/snapshots", json={"name": "nightly"}, headers=headers)
+    assert response.status_code == 201
+    assert response.get_json()["model_name"] == "fake-model"
+    assert client.post("/admin/snapshots", json={"name": "../escape"}, headers=headers).status_code == 400
+
+    listing = client.get("/admin/snapshots", headers=headers).get_json()
+    assert [item["name"] for item in listing["snapshots"]] == ["nightly"]
+
+
+def test_document_replace_and_delete(client):
+    document_id = _wait_for_job(client, _upload(client, "notes.txt"))["document_id"]
+
+    replace = client.put(
+        f"/documents/{document_id}",
+        data={"file": (io.BytesIO(b"ml model ranking notes"), "notes_v2.txt")},
+        content_type="multipart/form-data",
+    )
+    assert replace.status_code == 202
+    replaced = _wait_for_job(client, replace.get_json()["id"])
+    assert replaced["status"] == "completed"
+    assert replaced["document_id"] == document_id
+    assert client.get(f"/documents/{document_id}").get_json()["content"] == "ml model ranking notes"
+    results = client.get("/search?q=python").get_json()["results"]
+    assert [item["filename"] for item in results] == ["notes_v2.txt"]
+
+    assert client.delete(f"/documents/{document_id}").status_code == 200
+    assert client.get(f"/documents/{document_id}").status_code == 404
+    assert client.get("/search?q=python").get_json()["count"] == 0
+    assert client.delete(f"/documents/{document_id}").status_code == 404
+    assert client.put(f"/documents/{document_id}").status_code == 404
+
+
+def test_search_cursor_pagination_and_ndjson_stream(client):
+    for name in ("a.txt", "b.txt", "c.txt"):
+        assert _wait_for_job(client, _upload(client, name))["status"] == "completed"
+
+    first = client.get("/search?q=python backend&top_k=2").get_json()
+    assert first["count"] == 2
+    assert first["next_cursor"]
+    second = client.get(f"/search?q=python backend&top_k=2&cursor={first['next_cursor']}").get_json()
+    assert second["count"] == 1
+    assert second["next_cursor"] is None
+    filenames = {item["filename"] for item in first["results"] + second["results"]}
+    assert filenames == {"a.txt", "b.txt", "c.txt"}
+
+    assert client.get("/search?q=python backend&cursor=bogus").status_code == 400
+    assert client.get(f"/search?q=other&cursor={first['next_cursor']}").status_code == 400
+
+    response = client.get("/search?q=python backend&top_k=2&format=ndjson")
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line["type"] for line in lines] == ["result", "result", "end"]
+    assert [line["result"] for line in lines[:2]] == first["results"]
+    assert lines[-1]["next_cursor"] == first["next_cursor"]
+
+
+def test_search_cursor_is_bound_to_its_collection_and_options(client):
+    for collection, name in (("teamA", "a.txt"), ("teamA", "b.txt"), ("teamB", "c.txt")):
+        response = client.post(
+            "/documents",
+            data={"file": (io.BytesIO(b"python backend notes"), name), "collection": collection},
+            content_type="multipart/form-data",
+        )
+        assert _wait_for_job(client, response.get_json()["id"])["status"] == "completed"
+
+    first = client.get("/search?q=python&top_k=1&collection=teamA").get_json()
+    cursor = first["next_cursor"]
+    assert cursor
+    assert client.get(f"/search?q=python&top_k=1&collection=teamA&cursor={cursor}").status_code == 200
+
+    leaked = client.get(f"/search?q=python&top_k=1&collection=teamB&cursor={cursor}")
+    assert leaked.status_code == 400
+    assert "results" not in leaked.get_json()
+    assert client.get(f"/search?q=python&top_k=1&collection=teamA&fusion=rrf&cursor={cursor}").status_code == 400
+    assert client.get(f"/search?q=python&top_k=1&collection=teamA&min_score=0.5&cursor={cursor}").status_code == 400
+
+
+def test_documents_and_search_are_routed_by_collection(client):
+    response = client.post(
+        "/documents",
+        data={"file": (io.BytesIO(b"python backend notes"), "team.txt"), "collection": "team-a"},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 202
+    job = _wait_for_job(client, response.get_json()["id"])
+    assert job["collection"] == "team-a"
+    document_id = job["document_id"]
+
+    results = client.get("/search?q=python&collection=team-a").get_json()
+    assert results["collection"] == "team-a"
+    assert [item["filename"] for item in results["results"]] == ["team.txt"]
+    assert client.get("/search?q=python").get_json()["count"] == 0
+
+    assert client.get(f"/documents/{document_id}?collection=team-a").status_code == 200
+    assert client.get(f"/documents/{document_id}").status_code == 404
+    assert client.delete(f"/documents/{document_id}").status_code == 404
+    assert client.get("/search?q=python&collection=bad name").status_code == 400
+
+    collections = client.get("/collections").get_json()["collections"]
+    assert [item["name"] for item in collections] == ["team-a"]
+    assert collections[0]["documents"] == 1
+    assert collections[0]["resident_bytes"] > 0
+
+
+def test_search_fusion_mode_parameter(client):
+    assert _wait_for_job(client, _upload(client))["status"] == "completed"
+
+    body = client.get("/search?q=python backend&fusion=rrf").get_json()
+    assert body["fusion"] == "rrf"
+    assert body["results"][0]["filename"] == "resume_notes.txt"
+    assert client.get("/search?q=python&fusion=bogus").status_code == 400
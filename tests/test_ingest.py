@@ -1,6 +1,21 @@
+import io
+import sqlite3
+import time
+
+import pytest
+
+from services.compaction import CompactionTask
 from services.ingest import IngestService
-from services.storage import StorageService
-from tests.helpers import FakeEmbedder
+from services.jobs import LANE_SMALL, JobService
+from services.storage import CHUNK_PENDING, StaleIngestionError, StorageService
+from tests.helpers import FakeEmbedder, FakeTokenizingEmbedder
+from utils.text_processing import iter_chunk_spans, iter_words, snippet_for_chunk
+
+
+def _live_chunks(storage, collection="default"):
+    """Searchable chunks of ``collection``, read the way search does, in chunk order."""
+    ids = [row["id"] for row in storage.get_chunk_scoring_rows(collection)]
+    return sorted(storage.get_chunks_by_ids(ids), key=lambda chunk: chunk["chunk_index"])
 
 
 def test_ingest_persists_document_and_chunks(tmp_path):
@@ -15,9 +30,190 @@ def test_ingest_persists_document_and_chunks(tmp_path):
 
     result = ingest.ingest_document("notes.txt", b"python backend api search engine")
     document = storage.get_document(result["document_id"])
-    chunks = storage.get_all_chunks()
+    chunks = _live_chunks(storage)
 
     assert result["chunks_indexed"] > 0
     assert document is not None
     assert document["filename"] == "notes.txt"
     assert len(chunks) == result["chunks_indexed"]
+
+
+def test_ingest_streams_chunks_in_batches(tmp_path):
+    storage = StorageService(str(tmp_path / "ingest.db"))
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=FakeEmbedder(),
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=4,
+        chunk_overlap=1,
+        batch_size=2,
+    )
+    text = " ".join(f"word{index}" for index in range(20))
+
+    result = ingest.ingest_document("long.txt", text.encode())
+    content = storage.get_document(result["document_id"])["content"]
+    expected = [
+        span["text"] for span in iter_chunk_spans(((word, 1) for word in iter_words([text])), max_size=4, overlap=1)
+    ]
+
+    assert content == text
+    assert result["chunks_indexed"] == len(expected)
+    assert [content[chunk["start_offset"] : chunk["end_offset"]] for chunk in _live_chunks(storage)] == expected
+
+
+def test_ingest_rejects_empty_text_without_persisting(tmp_path):
+    storage = StorageService(str(tmp_path / "ingest.db"))
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=FakeEmbedder(),
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=4,
+        chunk_overlap=1,
+    )
+
+    with pytest.raises(ValueError):
+        ingest.ingest_document("blank.txt", b"   \n ")
+    assert storage.get_chunk_scoring_rows() == []
+
+
+def test_token_aware_chunks_fit_model_limit_and_store_offsets(tmp_path):
+    storage = StorageService(str(tmp_path / "ingest.db"))
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=FakeTokenizingEmbedder(),
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=450,
+        chunk_overlap=70,
+        chunk_overlap_tokens=2,
+    )
+    text = "python backend tokenization embeddings api search engine ranking snippets"
+
+    result = ingest.ingest_document("tokens.txt", text.encode())
+    content = storage.get_document(result["document_id"])["content"]
+    chunks = _live_chunks(storage)
+    with sqlite3.connect(storage.database_path) as conn:
+        token_counts = [row[0] for row in conn.execute("SELECT token_count FROM chunks")]
+
+    assert len(chunks) > 1
+    assert all(count <= FakeTokenizingEmbedder.max_input_tokens for count in token_counts)
+    for chunk in chunks:
+        assert chunk["snippet"] == snippet_for_chunk(content[chunk["start_offset"] : chunk["end_offset"]])
+    assert all(row["term_counts"] for row in storage.get_chunk_scoring_rows())
+    assert chunks[-1]["end_offset"] == len(content)
+
+
+def test_ingest_stores_text_once_in_compressed_blocks(tmp_path):
+    storage = StorageService(str(tmp_path / "ingest.db"))
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=FakeEmbedder(),
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=4,
+        chunk_overlap=1,
+        batch_size=2,
+    )
+    text = " ".join(f"word{index}" for index in range(20))
+
+    result = ingest.ingest_document("long.txt", text.encode())
+
+    with sqlite3.connect(storage.database_path) as conn:
+        assert conn.execute("SELECT content FROM documents").fetchone()[0] == ""
+        assert {row[0] for row in conn.execute("SELECT chunk_text FROM chunks")} == {""}
+        assert conn.execute("SELECT COUNT(*) FROM document_blocks").fetchone()[0] > 1
+    assert storage.get_document(result["document_id"])["content"] == text
+
+
+def test_tombstoned_documents_are_hidden_until_compaction_removes_them(tmp_path):
+    storage = StorageService(str(tmp_path / "ingest.db"))
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=FakeEmbedder(),
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=4,
+        chunk_overlap=1,
+    )
+    kept = ingest.ingest_document("kept.txt", b"python backend api search engine")
+    removed = ingest.ingest_document("removed.txt", b"ml model embeddings ranking notes")
+    compaction = CompactionTask(storage, threshold=0.5)
+
+    assert storage.tombstone_document(removed["document_id"], deleted_at="2026-01-01T00:00:00+00:00")
+    assert storage.get_document(removed["document_id"]) is None
+    assert {chunk["document_id"] for chunk in _live_chunks(storage)} == {kept["document_id"]}
+    assert compaction.compact_if_needed() == {"chunks_removed": removed["chunks_indexed"], "documents_removed": 1}
+    assert storage.tombstone_stats() == {"total": kept["chunks_indexed"], "tombstoned": 0, "orphaned": 0, "abandoned": 0}
+    assert compaction.compact_if_needed() is None
+
+
+def test_documents_abandoned_mid_ingest_stay_hidden_until_compaction_removes_them(tmp_path):
+    storage = StorageService(str(tmp_path / "ingest.db"))
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=FakeEmbedder(),
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=4,
+        chunk_overlap=1,
+    )
+    kept = ingest.ingest_document("kept.txt", b"python backend api search engine")
+    # A worker that died mid-ingest leaves a pending document with pending chunks behind.
+    orphan_id = storage.insert_document("orphan.txt", "", "2026-01-01T00:00:00+00:00", pending=True)
+    storage.insert_chunks(orphan_id, [{"chunk_index": 0, "chunk_text": "python orphan"}], state=CHUNK_PENDING)
+
+    assert storage.get_document(orphan_id) is None
+    assert not storage.document_exists(orphan_id)
+    assert storage.list_collections() == [{"name": "default", "documents": 1}]
+    assert CompactionTask(storage, pending_grace_seconds=60).compact_if_needed() is None
+
+    compaction = CompactionTask(storage, pending_grace_seconds=-1, vacuum=False)
+    assert compaction.compact_if_needed() == {"chunks_removed": 1, "documents_removed": 1}
+    assert storage.get_document(kept["document_id"]) is not None
+    assert storage.tombstone_stats() == {"total": kept["chunks_indexed"], "tombstoned": 0, "orphaned": 0, "abandoned": 0}
+
+
+
+def test_compaction_only_removes_pending_documents_whose_job_lost_its_lease(tmp_path):
+    storage = StorageService(str(tmp_path / "ingest.db"))
+    jobs = JobService(storage_service=storage, ingest_service=None, spool_dir=str(tmp_path / "spool"))
+    compaction = CompactionTask(storage, pending_grace_seconds=-1, vacuum=False)
+
+    class CompactingEmbedder(FakeEmbedder):
+        def encode(self, texts):
+            # A slow batch: compaction gets to run while the document is still pending.
+            compaction.compact_if_needed()
+            return super().encode(texts)
+
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=CompactingEmbedder(),
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=4,
+        chunk_overlap=1,
+        batch_size=1,
+    )
+    live = jobs.create_ingestion_job("live.txt", io.BytesIO(b"python backend"))
+    storage.claim_job("worker", (LANE_SMALL,), now=time.time(), lease_seconds=60, updated_at="now")
+    result = ingest.ingest_stream(
+        "live.txt", io.BytesIO(b"python backend api search engine"), job_id=live["id"], lease_owner="worker"
+    )
+    assert result["chunks_indexed"] > 1
+    assert storage.get_document(result["document_id"]) is not None
+
+    # A worker that crashed mid-ingest: its job's lease has expired.
+    crashed = jobs.create_ingestion_job("crashed.txt", io.BytesIO(b"python backend"))
+    storage.claim_job("dead-worker", (LANE_SMALL,), now=time.time(), lease_seconds=-1, updated_at="now")
+    orphan_id = storage.insert_document("crashed.txt", "", "now", pending=True, job_id=crashed["id"])
+    storage.insert_chunks(orphan_id, [{"chunk_index": 0, "chunk_text": "python orphan"}], state=CHUNK_PENDING)
+    # Chunks written after their pending document was already removed.
+    storage.insert_chunks(orphan_id + 1, [{"chunk_index": 0, "chunk_text": "python stray"}], state=CHUNK_PENDING)
+
+    assert compaction.compact_if_needed() == {"chunks_removed": 2, "documents_removed": 1}
+    with pytest.raises(StaleIngestionError):
+        storage.activate_document(orphan_id, "dead-worker")
+    # Without a job there is no lease to check, so a stale heartbeat counts; the ingestion then fails.
+    with pytest.raises(StaleIngestionError):
+        ingest.ingest_document("jobless.txt", b"python backend api search engine")
+    assert storage.tombstone_stats(time.time()) == {
+        "total": result["chunks_indexed"],
+        "tombstoned": 0,
+        "orphaned": 0,
+        "abandoned": 0,
+    }
@@ -0,0 +1,169 @@
+import io
+import sqlite3
+import threading
+import time
+
+from services.ingest import IngestService
+from services.jobs import LANE_LARGE, LANE_SMALL, JobService
+from services.storage import StorageService
+from tests.helpers import FakeEmbedder
+
+
+class FlakyIngestService:
+    """Fails a configurable number of times before succeeding."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = 0
+
+    def ingest_stream(
+        self, filename, stream, replaces_document_id=None, collection="default", job_id=None, lease_owner=None
+    ):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("transient failure")
+        return {"document_id": 42}
+
+
+def _job_service(tmp_path, ingest_service, **kwargs):
+    storage = StorageService(str(tmp_path / "jobs.db"))
+    return JobService(
+        storage_service=storage,
+        ingest_service=ingest_service,
+        spool_dir=str(tmp_path / "spool"),
+        retry_backoff_seconds=0.0,
+        **kwargs,
+    )
+
+
+def test_queued_job_survives_restart(tmp_path):
+    crashed = _job_service(tmp_path, FlakyIngestService())
+    job = crashed.create_ingestion_job("notes.txt", io.BytesIO(b"python backend"))
+
+    restarted = _job_service(tmp_path, FlakyIngestService())
+    assert restarted.run_pending() == 1
+
+    finished = restarted.get_job(job["id"])
+    assert finished["status"] == "completed"
+    assert finished["document_id"] == 42
+    assert not list((tmp_path / "spool").iterdir())
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    service = _job_service(tmp_path, FlakyIngestService())
+    job = service.create_ingestion_job("notes.txt", io.BytesIO(b"python backend"))
+    claimed = service.storage_service.claim_job(
+        "dead-worker", (LANE_SMALL,), now=time.time(), lease_seconds=-1, updated_at=job["created_at"]
+    )
+    assert claimed["id"] == job["id"]
+
+    assert service.run_pending() == 1
+    assert service.get_job(job["id"])["status"] == "completed"
+
+
+def test_worker_that_lost_its_lease_keeps_the_payload(tmp_path):
+    service = _job_service(tmp_path, FlakyIngestService())
+    job = service.create_ingestion_job("notes.txt", io.BytesIO(b"python backend"))
+    storage = service.storage_service
+    slow = storage.claim_job("slow-worker", (LANE_SMALL,), now=time.time(), lease_seconds=-1, updated_at="now")
+    taken_over = storage.claim_job("new-worker", (LANE_SMALL,), now=time.time(), lease_seconds=60, updated_at="now")
+    assert slow["id"] == taken_over["id"] == job["id"]
+
+    service._run_ingestion_job(slow, "slow-worker")
+    assert service.get_job(job["id"])["status"] == "processing"
+    assert list((tmp_path / "spool").iterdir())
+
+    service._run_ingestion_job(taken_over, "new-worker")
+    assert service.get_job(job["id"])["status"] == "completed"
+    assert not list((tmp_path / "spool").iterdir())
+
+
+def test_only_the_current_lease_holder_publishes_its_document(tmp_path):
+    storage = StorageService(str(tmp_path / "jobs.db"))
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=FakeEmbedder(),
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=4,
+        chunk_overlap=1,
+    )
+    service = JobService(storage_service=storage, ingest_service=ingest, spool_dir=str(tmp_path / "spool"))
+    job = service.create_ingestion_job("notes.txt", io.BytesIO(b"python backend api search engine"))
+    slow = storage.claim_job("slow-worker", (LANE_SMALL,), now=time.time(), lease_seconds=-1, updated_at="now")
+    taken_over = storage.claim_job("new-worker", (LANE_SMALL,), now=time.time(), lease_seconds=60, updated_at="now")
+
+    service._run_ingestion_job(slow, "slow-worker")
+    service._run_ingestion_job(taken_over, "new-worker")
+
+    finished = service.get_job(job["id"])
+    assert finished["status"] == "completed"
+    assert storage.list_collections() == [{"name": "default", "documents": 1}]
+    with sqlite3.connect(storage.database_path) as conn:
+        assert conn.execute("SELECT id FROM documents").fetchall() == [(finished["document_id"],)]
+        assert conn.execute("SELECT DISTINCT document_id FROM chunks").fetchall() == [(finished["document_id"],)]
+
+
+def test_transient_failures_are_retried_until_budget_exhausted(tmp_path):
+    service = _job_service(tmp_path, FlakyIngestService(failures=1), max_attempts=2)
+    job = service.create_ingestion_job("notes.txt", io.BytesIO(b"python backend"))
+    service.run_pending()
+    assert service.get_job(job["id"])["status"] == "completed"
+    assert service.get_job(job["id"])["attempts"] == 2
+
+    exhausted = _job_service(tmp_path, FlakyIngestService(failures=5), max_attempts=2)
+    job = exhausted.create_ingestion_job("other.txt", io.BytesIO(b"python backend"))
+    exhausted.run_pending()
+    failed = exhausted.get_job(job["id"])
+    assert failed["status"] == "failed"
+    assert failed["error_message"] == "transient failure"
+
+
+def test_large_jobs_use_separate_lane_and_queued_jobs_can_be_cancelled(tmp_path):
+    service = _job_service(tmp_path, FlakyIngestService(), small_job_max_bytes=16)
+    large = service.create_ingestion_job("big.pdf", io.BytesIO(b"x" * 8))
+    small = service.create_ingestion_job("small.txt", io.BytesIO(b"x" * 8))
+    assert large["lane"] == LANE_LARGE
+    assert small["lane"] == LANE_SMALL
+
+    assert service.cancel_job(large["id"])["status"] == "cancelled"
+    assert service.run_pending(lanes=(LANE_SMALL,)) == 1
+    assert service.cancel_job(small["id"]) is None
+
+
+def test_collection_worker_quota_limits_concurrent_claims(tmp_path):
+    service = _job_service(tmp_path, FlakyIngestService())
+    for _ in range(3):
+        service.create_ingestion_job("big.txt", io.BytesIO(b"python"), collection="big")
+    service.create_ingestion_job("small.txt", io.BytesIO(b"python"), collection="small")
+
+    def claim(owner, **quotas):
+        return service.storage_service.claim_job(
+            owner, (LANE_SMALL,), now=time.time(), lease_seconds=60, updated_at="now", **quotas
+        )
+
+    assert claim("worker-1", collection_max_workers=1)["collection"] == "big"
+    assert claim("worker-2", collection_max_workers=1)["collection"] == "small"
+    assert claim("worker-3", collection_max_workers=1) is None
+    overridden = claim("worker-3", collection_max_workers=1, collection_worker_quotas={"big": 2})
+    assert overridden["collection"] == "big"
+    assert claim("worker-4") is not None
+
+
+def test_long_poll_notices_changes_made_by_another_process(tmp_path):
+    service = _job_service(tmp_path, FlakyIngestService(), poll_interval_seconds=0.05)
+    job = service.create_ingestion_job("notes.txt", io.BytesIO(b"python backend"))
+    storage = service.storage_service
+    storage.claim_job("other-process", (LANE_SMALL,), now=time.time(), lease_seconds=60, updated_at="now")
+    # Completed by a worker in another process, so nothing is published to this one.
+    finish = {"job_id": job["id"], "owner": "other-process", "status": "completed", "updated_at": "later"}
+    finisher = threading.Timer(0.1, storage.release_job, kwargs=finish)
+
+    service.start()
+    finisher.start()
+    try:
+        started = time.monotonic()
+        assert service.wait_for_job(job["id"], timeout=3)["status"] == "completed"
+        assert time.monotonic() - started < 1
+    finally:
+        finisher.join()
+        service.stop(timeout=1)
@@ -0,0 +1,61 @@
+from app import create_app
+from config import Config
+from services.ingest import IngestService
+from services.replication import IndexPublisher, IndexSubscriber, read_current_generation
+from services.search import SearchService
+from services.storage import StorageService
+from tests.helpers import FakeEmbedder
+
+
+def test_searcher_switches_to_published_generations(tmp_path):
+    publish_dir = str(tmp_path / "generations")
+    indexer_storage = StorageService(str(tmp_path / "indexer.db"))
+    ingest = IngestService(
+        storage_service=indexer_storage,
+        embedder=FakeEmbedder(),
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=50,
+        chunk_overlap=10,
+    )
+    publisher = IndexPublisher(indexer_storage, publish_dir, model_name="fake-model", keep_generations=1)
+    search = SearchService(StorageService(str(tmp_path / "searcher.db")), FakeEmbedder())
+    subscriber = IndexSubscriber(search, publish_dir, str(tmp_path / "searcher"), model_name="fake-model")
+
+    ingest.ingest_document("python.txt", b"python backend flask api project")
+    assert publisher.publish_if_changed()["name"] == "gen-000001"
+    assert publisher.publish_if_changed() is None
+    assert subscriber.refresh()
+    assert [item["filename"] for item in search.hybrid_search("python", min_score=-1.0)] == ["python.txt"]
+
+    ingest.ingest_document("ml.txt", b"ml model embeddings and ranking")
+    publisher.publish_if_changed()
+    assert read_current_generation(publish_dir) == "gen-000002"
+    assert not (tmp_path / "generations" / "gen-000001").exists()
+    assert subscriber.refresh()
+    assert subscriber.generation == "gen-000002"
+    assert len(search.hybrid_search("model", min_score=-1.0)) == 2
+    assert not subscriber.refresh()
+
+
+def test_searcher_role_disables_ingestion_and_admin_endpoints(tmp_path):
+    config = Config(
+        model_name="fake-model",
+        role="searcher",
+        database_path=str(tmp_path / "test.db"),
+        uploads_dir=str(tmp_path / "uploads"),
+        jobs_spool_dir=str(tmp_path / "spool"),
+        snapshots_dir=str(tmp_path / "snapshots"),
+        admin_token="test-admin-token",
+        index_publish_dir=str(tmp_path / "generations"),
+        searcher_data_dir=str(tmp_path / "searcher"),
+    )
+    app = create_app(config=config, embedder=FakeEmbedder())
+    client = app.test_client()
+    try:
+        assert client.get("/jobs/some-id").status_code == 404
+        headers = {"X-Admin-Token": "test-admin-token"}
+        assert client.post("/admin/snapshots", json={"name": "nightly"}, headers=headers).status_code == 404
+        assert client.get("/search?q=python").status_code == 200
+        assert client.get("/health").get_json() == {"status": "ok", "role": "searcher", "generation": None}
+    finally:
+        app.extensions["index_subscriber"].stop(timeout=1)
@@ -1,7 +1,18 @@
+import io
+import json
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from services.collections import CollectionIndex
 from services.ingest import IngestService
-from services.search import SearchService
+from services.search import CursorExpiredError, SearchService, reciprocal_rank_fusion
 from services.storage import StorageService
 from tests.helpers import FakeEmbedder
+from utils.vectors import vector_to_bytes
 
 
 def test_search_returns_ranked_matches(tmp_path):
@@ -25,3 +36,230 @@ def test_search_returns_ranked_matches(tmp_path):
     assert results[0]["filename"] == "python.txt"
     assert "semantic_score" in results[0]
     assert "lexical_score" in results[0]
+
+
+def test_search_reads_legacy_uncompressed_chunks(tmp_path):
+    storage = StorageService(str(tmp_path / "search.db"))
+    embedder = FakeEmbedder()
+    search = SearchService(storage_service=storage, embedder=embedder)
+    text = "python backend flask api project"
+    document_id = storage.insert_document("legacy.txt", text, "2026-01-01T00:00:00+00:00")
+    storage.insert_chunks(
+        document_id,
+        [{"chunk_index": 0, "chunk_text": text, "embedding": json.dumps(embedder.encode([text])[0].tolist())}],
+    )
+
+    results = search.hybrid_search("python backend", limit=1, min_score=-1.0)
+
+    assert results[0]["filename"] == "legacy.txt"
+    assert results[0]["lexical_score"] == 1.0
+    assert results[0]["snippet"] == text
+
+
+def test_search_pages_reuse_cached_ranking(tmp_path, monkeypatch):
+    storage = StorageService(str(tmp_path / "search.db"))
+    embedder = FakeEmbedder()
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=embedder,
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=80,
+        chunk_overlap=10,
+    )
+    search = SearchService(storage_service=storage, embedder=embedder)
+    for index in range(5):
+        ingest.ingest_document(f"doc{index}.txt", f"python backend note {index}".encode("utf-8"))
+
+    scoring_calls = []
+    original_rows = storage.get_chunk_scoring_rows
+    monkeypatch.setattr(
+        storage, "get_chunk_scoring_rows", lambda *args: scoring_calls.append(1) or original_rows(*args)
+    )
+
+    filenames = []
+    cursor = None
+    while True:
+        results, cursor = search.search_page("python backend", limit=2, cursor=cursor, min_score=-1.0)
+        filenames.extend(item["filename"] for item in results)
+        if cursor is None:
+            break
+        # Pages issued before an index change keep paging through the ranking they started from.
+        ingest.ingest_document("late.txt", b"python backend python backend late")
+
+    assert sorted(filenames) == [f"doc{index}.txt" for index in range(5)]
+    assert len(scoring_calls) == 1
+
+    search.ranking_cache_size = 1
+    _, stale_cursor = search.search_page("python backend", limit=2, min_score=-1.0)
+    ingest.ingest_document("later.txt", b"python backend")
+    search.search_page("ml model", limit=2, min_score=-1.0)
+    with pytest.raises(CursorExpiredError):
+        search.search_page("python backend", limit=2, cursor=stale_cursor, min_score=-1.0)
+    with pytest.raises(ValueError):
+        search.search_page("python backend", limit=2, cursor="not-a-cursor", min_score=-1.0)
+
+
+def test_collections_are_searched_separately_within_memory_budget(tmp_path):
+    storage = StorageService(str(tmp_path / "search.db"))
+    embedder = FakeEmbedder()
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=embedder,
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=80,
+        chunk_overlap=10,
+    )
+    ingest.ingest_document("a.txt", b"python backend flask api project", collection="team-a")
+    ingest.ingest_document("b.txt", b"python backend ml model", collection="team-b")
+
+    search = SearchService(storage_service=storage, embedder=embedder)
+    assert [item["filename"] for item in search.hybrid_search("python", min_score=-1.0, collection="team-a")] == [
+        "a.txt"
+    ]
+    assert [item["filename"] for item in search.hybrid_search("python", min_score=-1.0, collection="team-b")] == [
+        "b.txt"
+    ]
+    assert search.hybrid_search("python", min_score=-1.0) == []
+    assert set(search.index_cache.resident(storage.database_path)) == {"default", "team-a", "team-b"}
+
+    # Room for one collection only: the least recently searched one is evicted.
+    budget = search.index_cache.resident(storage.database_path)["team-a"].nbytes
+    budgeted = SearchService(storage_service=storage, embedder=embedder, memory_budget_bytes=budget)
+    budgeted.hybrid_search("python", min_score=-1.0, collection="team-a")
+    budgeted.hybrid_search("python", min_score=-1.0, collection="team-b")
+    assert set(budgeted.index_cache.resident(storage.database_path)) == {"team-b"}
+    assert len(budgeted.hybrid_search("python", min_score=-1.0, collection="team-a")) == 1
+
+    # A new generation of a collection replaces its resident index.
+    ingest.ingest_document("a2.txt", b"python backend again", collection="team-a")
+    assert len(search.hybrid_search("python", min_score=-1.0, collection="team-a")) == 2
+
+
+def test_top_lexical_early_termination_matches_exhaustive_scoring():
+    rng = np.random.default_rng(7)
+    vocabulary = [f"term{index}" for index in range(30)]
+    # Skewed term frequencies, so common terms have long postings and rare ones short.
+    weights = np.linspace(2, 0.1, 30) / np.linspace(2, 0.1, 30).sum()
+    rows = []
+    for chunk_id in range(500):
+        terms = rng.choice(vocabulary, size=rng.integers(1, 8), p=weights)
+        rows.append(
+            {
+                "id": chunk_id,
+                "embedding_vector": vector_to_bytes(rng.random(3)),
+                "term_counts": json.dumps(Counter(str(term) for term in terms)),
+            }
+        )
+    index = CollectionIndex.build("default", 1, rows)
+
+    for query in (["term0", "term1", "term25"], ["term29", "term3", "term3"], ["missing", "term10"]):
+        exhaustive = index.lexical_scores(query)
+        positions, scores = index.top_lexical(query, 10)
+        expected = np.sort(exhaustive[exhaustive > 0])[::-1][:10]
+        assert np.allclose(scores, expected)
+        assert np.allclose(exhaustive[positions], scores)
+
+
+def test_fusion_modes_retrieve_candidates_independently(tmp_path):
+    storage = StorageService(str(tmp_path / "search.db"))
+    embedder = FakeEmbedder()
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=embedder,
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=80,
+        chunk_overlap=10,
+    )
+    search = SearchService(storage_service=storage, embedder=embedder)
+    ingest.ingest_document("python.txt", b"python backend flask api project")
+    ingest.ingest_document("ml.txt", b"ml model embeddings and ranking")
+    ingest.ingest_document("notes.txt", b"meeting notes")
+
+    weighted = search.hybrid_search("python backend", min_score=-1.0)
+    for fusion in ("rrf", "normalized"):
+        fused = search.hybrid_search(
+            "python backend", min_score=-1.0, fusion=fusion, semantic_candidates=1, lexical_candidates=1
+        )
+        # Only the single best candidate of each retriever is fused, and it is scored exactly.
+        assert [item["filename"] for item in fused] == ["python.txt"]
+        assert fused[0]["semantic_score"] == weighted[0]["semantic_score"]
+        assert fused[0]["lexical_score"] == weighted[0]["lexical_score"]
+
+    with pytest.raises(ValueError):
+        search.hybrid_search("python", fusion="unknown")
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    positions, scores = reciprocal_rank_fusion([np.array([3, 1, 2]), np.array([1, 4])], k=60)
+    fused = dict(zip(positions.tolist(), scores.tolist()))
+    assert max(fused, key=fused.get) == 1
+    assert fused[1] == pytest.approx(1 / 62 + 1 / 61)
+    assert set(fused) == {1, 2, 3, 4}
+
+
+def test_resident_index_is_updated_in_place_and_rebuilt_only_after_compaction(tmp_path):
+    storage = StorageService(str(tmp_path / "search.db"))
+    embedder = FakeEmbedder()
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=embedder,
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=80,
+        chunk_overlap=10,
+    )
+    search = SearchService(storage_service=storage, embedder=embedder)
+    full_builds = []
+    scoring_rows = storage.get_chunk_scoring_rows
+    storage.get_chunk_scoring_rows = lambda collection: full_builds.append(collection) or scoring_rows(collection)
+
+    def filenames(fusion="weighted"):
+        return sorted(item["filename"] for item in search.hybrid_search("python", min_score=-1.0, fusion=fusion))
+
+    first = ingest.ingest_document("a.txt", b"python backend flask api project")["document_id"]
+    assert filenames() == ["a.txt"]
+    ingest.ingest_document("b.txt", b"python ml model ranking")
+    assert filenames() == ["a.txt", "b.txt"]
+    ingest.ingest_stream("a2.txt", io.BytesIO(b"python backend again"), replaces_document_id=first)
+    assert filenames() == ["a2.txt", "b.txt"]
+    assert storage.tombstone_document(first, deleted_at="now")
+    assert filenames() == filenames("rrf") == ["b.txt"]
+    index = search.index_cache.resident(storage.database_path)["default"]
+    assert len(index) == 3 and int(index.live.sum()) == 1
+    assert full_builds == ["default"]
+
+    storage.compact(vacuum=False)
+    assert filenames() == ["b.txt"]
+    assert len(search.index_cache.resident(storage.database_path)["default"]) == 1
+    assert full_builds == ["default", "default"]
+
+
+def test_concurrent_searches_build_a_collection_index_once(tmp_path):
+    storage = StorageService(str(tmp_path / "search.db"))
+    embedder = FakeEmbedder()
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=embedder,
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=80,
+        chunk_overlap=10,
+    )
+    ingest.ingest_document("a.txt", b"python backend flask api project")
+    search = SearchService(storage_service=storage, embedder=embedder)
+    full_builds = []
+    scoring_rows = storage.get_chunk_scoring_rows
+
+    def slow_scoring_rows(collection):
+        full_builds.append(collection)
+        time.sleep(0.05)
+        return scoring_rows(collection)
+
+    storage.get_chunk_scoring_rows = slow_scoring_rows
+    generation = storage.index_generation("default")
+    threads = [
+        threading.Thread(target=search.index_cache.get, args=(storage, "default", generation)) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert full_builds == ["default"]
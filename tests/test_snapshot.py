@@ -0,0 +1,52 @@
+import pytest
+
+from services.ingest import IngestService
+from services.search import SearchService
+from services.snapshot import SnapshotService, restore_snapshot
+from services.storage import StorageService
+from tests.helpers import FakeEmbedder
+
+
+def _indexed_storage(tmp_path):
+    storage = StorageService(str(tmp_path / "source.db"))
+    ingest = IngestService(
+        storage_service=storage,
+        embedder=FakeEmbedder(),
+        uploads_dir=str(tmp_path / "uploads"),
+        max_chunk_size=4,
+        chunk_overlap=1,
+    )
+    ingest.ingest_document("python.txt", b"python backend flask api project with many words")
+    ingest.ingest_document("ml.txt", b"ml model embeddings and ranking")
+    return storage
+
+
+def test_snapshot_restore_serves_identical_results(tmp_path):
+    storage = _indexed_storage(tmp_path)
+    snapshots = SnapshotService(storage, str(tmp_path / "snapshots"), model_name="fake-model")
+
+    manifest = snapshots.create_snapshot("nightly")
+    restore_snapshot(str(tmp_path / "snapshots" / "nightly"), str(tmp_path / "replica.db"), expected_model="fake-model")
+
+    replica = StorageService(str(tmp_path / "replica.db"))
+    assert manifest["dimension"] == 3
+    assert manifest["counts"]["chunks"] == len(storage.get_chunk_scoring_rows())
+    assert [item["name"] for item in snapshots.list_snapshots()] == ["nightly"]
+    assert replica.get_document(1)["content"] == storage.get_document(1)["content"]
+
+    original = SearchService(storage, FakeEmbedder()).hybrid_search("python backend", min_score=-1.0)
+    restored = SearchService(replica, FakeEmbedder()).hybrid_search("python backend", min_score=-1.0)
+    assert restored == original
+
+
+def test_restore_rejects_model_mismatch_and_corruption(tmp_path):
+    storage = _indexed_storage(tmp_path)
+    SnapshotService(storage, str(tmp_path / "snapshots"), model_name="fake-model").create_snapshot("nightly")
+    snapshot_dir = tmp_path / "snapshots" / "nightly"
+
+    with pytest.raises(ValueError, match="model"):
+        restore_snapshot(str(snapshot_dir), str(tmp_path / "a.db"), expected_model="other-model")
+
+    (snapshot_dir / "chunks.jsonl").write_text("{}\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="checksum"):
+        restore_snapshot(str(snapshot_dir), str(tmp_path / "b.db"))
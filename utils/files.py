@@ -1,12 +1,14 @@
+import codecs
 import io
 import re
 from pathlib import Path
-from typing import Set
+from typing import BinaryIO, Iterator, Set
 
 import docx
 from PyPDF2 import PdfReader
 
 ALLOWED_EXTENSIONS: Set[str] = {".txt", ".pdf", ".docx"}
+TEXT_READ_BLOCK_SIZE = 64 * 1024
 
 
 def sanitize_filename(filename: str) -> str:
@@ -19,14 +21,35 @@ def is_allowed_extension(filename: str) -> bool:
     return Path(filename).suffix.lower() in ALLOWED_EXTENSIONS
 
 
-def extract_text_from_bytes(filename: str, payload: bytes) -> str:
+def iter_text_from_stream(filename: str, stream: BinaryIO) -> Iterator[str]:
+    """Yield extracted text incrementally (text blocks, PDF pages, DOCX paragraphs).
+
+    Pieces are meant to be concatenated as-is; separators between pages and paragraphs
+    are yielded explicitly, so a piece boundary may fall in the middle of a word.
+    """
     extension = Path(filename).suffix.lower()
     if extension == ".txt":
-        return payload.decode("utf-8", errors="ignore")
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        for block in iter(lambda: stream.read(TEXT_READ_BLOCK_SIZE), b""):
+            yield decoder.decode(block)
+        yield decoder.decode(b"", final=True)
+        return
     if extension == ".pdf":
-        reader = PdfReader(io.BytesIO(payload))
-        return "\n".join(page.extract_text() or "" for page in reader.pages)
+        for index, page in enumerate(PdfReader(stream).pages):
+            if index:
+                yield "\n"
+            yield page.extract_text() or ""
+        return
     if extension == ".docx":
-        document = docx.Document(io.BytesIO(payload))
-        return "\n".join(paragraph.text for paragraph in document.paragraphs if paragraph.text.strip())
+        document = docx.Document(stream)
+        paragraphs = (paragraph.text for paragraph in document.paragraphs if paragraph.text.strip())
+        for index, text in enumerate(paragraphs):
+            if index:
+                yield "\n"
+            yield text
+        return
     raise ValueError("Unsupported file extension")
+
+
+def extract_text_from_bytes(filename: str, payload: bytes) -> str:
+    return "".join(iter_text_from_stream(filename, io.BytesIO(payload)))
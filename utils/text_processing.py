@@ -1,28 +1,78 @@
-from typing import List
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, List, Tuple
 
 
 def normalize_text(text: str) -> str:
     return " ".join(text.split())
 
 
-def chunk_text(text: str, max_chunk_size: int = 450, overlap: int = 70) -> List[str]:
-    words = normalize_text(text).split()
-    if not words:
-        return []
-
-    chunks: List[str] = []
-    start = 0
-    step = max(max_chunk_size - overlap, 1)
-
-    while start < len(words):
-        end = min(start + max_chunk_size, len(words))
-        chunk = " ".join(words[start:end]).strip()
-        if chunk:
-            chunks.append(chunk)
-        if end >= len(words):
-            break
-        start += step
-    return chunks
+def iter_words(pieces: Iterable[str]) -> Iterator[str]:
+    """Yield whitespace-separated words from text pieces that may split words across boundaries."""
+    carry = ""
+    for piece in pieces:
+        text = carry + piece
+        if not text:
+            continue
+        words = text.split()
+        carry = "" if text[-1].isspace() or not words else words.pop()
+        yield from words
+    if carry:
+        yield carry
+
+
+def tokenize_terms(text: str) -> List[str]:
+    """Lexical terms used for keyword scoring."""
+    return [token for token in text.lower().split() if token]
+
+
+def iter_chunk_spans(words: Iterable[Tuple[str, int]], max_size: int = 450, overlap: int = 70) -> Iterator[Dict]:
+    """Stream overlapping chunks from ``(word, size)`` pairs.
+
+    ``size`` is the word's cost against the ``max_size`` budget: 1 for plain word windows, or
+    the tokenizer's word-piece count for model-aware chunking. Each chunk carries its character
+    offsets into ``" ".join(words)`` and its total size. Consecutive chunks share a suffix of at
+    most ``overlap`` units. Only the current window (one chunk plus one word) is held in memory.
+    """
+    overlap = max(overlap, 0)
+    window: Deque[Tuple[str, int, int]] = deque()
+    window_size = 0
+    position = 0
+    for word, size in words:
+        window.append((word, size, position))
+        window_size += size
+        position += len(word) + 1
+        # The window without its newest word always fits, so a chunk is emitted only once a word
+        # overflows it; the final chunk is therefore never a duplicate tail of the previous one.
+        if window_size <= max_size or len(window) == 1:
+            continue
+        newest = window.pop()
+        window_size -= size
+        yield _span_from_window(window, window_size)
+
+        keep_budget = min(overlap, max_size - size)
+        kept: Deque[Tuple[str, int, int]] = deque()
+        kept_size = 0
+        while len(window) > len(kept) + 1:
+            candidate = window[-1 - len(kept)]
+            if kept_size + candidate[1] > keep_budget:
+                break
+            kept.appendleft(candidate)
+            kept_size += candidate[1]
+        window = kept
+        window.append(newest)
+        window_size = kept_size + size
+    if window:
+        yield _span_from_window(window, window_size)
+
+
+def _span_from_window(window: Deque[Tuple[str, int, int]], window_size: int) -> Dict:
+    last_word, _, last_start = window[-1]
+    return {
+        "text": " ".join(word for word, _, _ in window),
+        "start_offset": window[0][2],
+        "end_offset": last_start + len(last_word),
+        "size": window_size,
+    }
 
 
 def snippet_for_chunk(chunk: str, max_length: int = 180) -> str:
@@ -0,0 +1,15 @@
+import json
+from typing import Dict
+
+import numpy as np
+
+
+def vector_to_bytes(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def decode_embedding(chunk: Dict) -> np.ndarray:
+    """Return a chunk's embedding from its float32 blob, or the legacy JSON column."""
+    if chunk.get("embedding_vector"):
+        return np.frombuffer(chunk["embedding_vector"], dtype=np.float32)
+    return np.array(json.loads(chunk["embedding"]), dtype=np.float32)